@@ -0,0 +1,189 @@
+"""
+Benchmark runner for lab4.py.
+
+Times parsing, generation (eager and lazy), counting, the compiled DFA matcher and its
+step-by-step trace mode on the Variant 4 regexes plus a few synthetic deep/wide patterns.
+Every benchmark reports its best wall time over several runs, its throughput and the peak
+memory allocated during one run (measured separately with tracemalloc, which slows code down).
+
+Usage:
+    python benchmark.py                       # print a table
+    python benchmark.py --json results.json   # also write the results as JSON
+    python benchmark.py --compare old.json results.json
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import lab4
+
+
+def deep_pattern(depth):
+    """((((a|b)c|d)c|d)...) nested 'depth' levels deep."""
+    pattern = "(a|b)"
+    for _ in range(depth):
+        pattern = f"({pattern}c|d)"
+    return pattern
+
+
+def wide_pattern(width):
+    """One alternation of 'width' two-letter options, repeated twice."""
+    options = [chr(ord('A') + i % 26) + chr(ord('a') + i // 26 % 26) for i in range(width)]
+    return "(" + "|".join(options) + ")^2"
+
+
+PATTERNS = {
+    "variant4_1": "(S|T)(U|V)W*Y+24",
+    "variant4_2": "L(M|N)O^3P*Q(2|3)",
+    "variant4_3": "R*S(T|U|V)W(X|Y|Z)^2",
+    "variant3_example": "O(P|Q|R)+2(3|4)",
+    "deep_nesting": deep_pattern(60),
+    "wide_alternation": wide_pattern(100),
+    "long_sequence": "(a|b)" * 14,
+    "classes_and_bounds": "[a-f]{2,3}(x|y)?[0-9]{2}",
+}
+
+# Cap on the number of strings used as matching input per pattern.
+MATCH_INPUTS = 20000
+
+
+def measure(fn, repeat):
+    """
+    Runs fn() 'repeat' times and returns (best seconds, result of the last run, peak bytes).
+    """
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, result, peak
+
+
+def record(seconds, items, peak):
+    return {
+        "seconds": seconds,
+        "items": items,
+        "items_per_sec": items / seconds if seconds > 0 else None,
+        "peak_bytes": peak,
+    }
+
+
+def bench_pattern(regex, repeat, max_repeat):
+    """
+    Runs every benchmark on one pattern and returns its language size and {benchmark name: record}.
+    """
+    results = {}
+    tree = lab4.parse_regex(regex)
+    total = lab4.count_from_tree(tree, max_repeat=max_repeat)
+
+    seconds, _, peak = measure(lambda: lab4.parse_regex(regex), repeat)
+    results["parse_regex"] = record(seconds, 1, peak)
+
+    seconds, _, peak = measure(lambda: lab4.count_from_tree(tree, max_repeat=max_repeat), repeat)
+    results["count_from_tree"] = record(seconds, 1, peak)
+
+    seconds, strings, peak = measure(lambda: lab4.generate_from_tree(tree, max_repeat), repeat)
+    results["generate_from_tree"] = record(seconds, len(strings), peak)
+
+    def lazy():
+        count = 0
+        for _ in lab4.iter_from_tree(tree, max_repeat=max_repeat):
+            count += 1
+        return count
+    seconds, count, peak = measure(lazy, repeat)
+    results["iter_from_tree"] = record(seconds, count, peak)
+
+    seconds, compiled, peak = measure(lambda: lab4.compile_tree(tree, regex), repeat)
+    results["compile_tree"] = record(seconds, 1, peak)
+
+    # Matching input: generated strings plus the same strings with a junk suffix.
+    step = max(1, len(strings) // (MATCH_INPUTS // 2))
+    positives = strings[::step][:MATCH_INPUTS // 2]
+    inputs = positives + [s + "#" for s in positives]
+
+    def step_by_step():
+        return sum(compiled.trace(s)[0] for s in inputs)
+    seconds, _, peak = measure(step_by_step, repeat)
+    results["compiled_trace"] = record(seconds, len(inputs), peak)
+
+    seconds, matched, peak = measure(lambda: lab4.match_many(compiled, inputs), repeat)
+    results["compiled_match"] = record(seconds, len(inputs), peak)
+    if sum(matched) != len(positives):
+        raise AssertionError(f"Compiled matcher disagrees with the generator on {regex!r}")
+
+    return {"regex": regex, "language_size": total, "benchmarks": results}
+
+
+def run(patterns, repeat, max_repeat):
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "max_repeat": max_repeat,
+        "patterns": {name: bench_pattern(regex, repeat, max_repeat) for name, regex in patterns.items()},
+    }
+
+
+def print_report(report):
+    print(f"{'pattern':<20} {'benchmark':<20} {'seconds':>12} {'items/sec':>14} {'peak KiB':>10}")
+    for name, entry in report["patterns"].items():
+        for bench, r in entry["benchmarks"].items():
+            rate = f"{r['items_per_sec']:.0f}" if r["items_per_sec"] else "-"
+            print(f"{name:<20} {bench:<20} {r['seconds']:>12.6f} {rate:>14} {r['peak_bytes'] / 1024:>10.1f}")
+
+
+def print_comparison(old, new):
+    """
+    Prints the speed ratio (old time / new time) of every benchmark present in both reports.
+    """
+    print(f"{'pattern':<20} {'benchmark':<20} {'old s':>12} {'new s':>12} {'speedup':>9}")
+    for name, entry in new["patterns"].items():
+        old_entry = old["patterns"].get(name)
+        if old_entry is None:
+            continue
+        for bench, r in entry["benchmarks"].items():
+            o = old_entry["benchmarks"].get(bench)
+            if o is None:
+                continue
+            ratio = o["seconds"] / r["seconds"] if r["seconds"] else float("inf")
+            print(f"{name:<20} {bench:<20} {o['seconds']:>12.6f} {r['seconds']:>12.6f} {ratio:>8.2f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark lab4 regex generation and matching.")
+    parser.add_argument("--json", help="write the results to this JSON file")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per benchmark (best is kept)")
+    parser.add_argument("--max-repeat", type=int, default=5, help="cap for unbounded quantifiers")
+    parser.add_argument("--pattern", action="append", help="only run the named pattern(s)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two JSON result files")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as f_old, open(args.compare[1]) as f_new:
+            print_comparison(json.load(f_old), json.load(f_new))
+        return
+
+    patterns = PATTERNS
+    if args.pattern:
+        unknown = set(args.pattern) - set(PATTERNS)
+        if unknown:
+            sys.exit(f"Unknown pattern(s): {', '.join(sorted(unknown))}")
+        patterns = {name: PATTERNS[name] for name in args.pattern}
+
+    report = run(patterns, args.repeat, args.max_repeat)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
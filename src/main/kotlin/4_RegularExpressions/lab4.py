@@ -1,25 +1,214 @@
+import heapq
+import mmap
+import os
+import random
+import threading
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+
+# --- Parse Tree --- #
+
+# Integer opcodes of the parse tree nodes; evaluators dispatch on these instead of strings.
+LITERAL, SEQUENCE, ALTERNATION, REPEAT, CHAR_CLASS = range(5)
+
+
+class Node:
+    """
+    Base class of the parse tree nodes. Every subclass defines its opcode in 'op'
+    and uses __slots__, so a node costs a few machine words instead of a dict.
+    """
+    __slots__ = ()
+    op = None
+
+    def children(self):
+        return ()
+
+    def to_dict(self):
+        """
+        Converts the tree to the nested-dict form that parse_regex used to return
+        ({"type": "literal", "value": ...}, {"type": "sequence", "elements": [...]}, ...).
+        """
+        converted = {}
+        for node in postorder(self):
+            if node.op == LITERAL:
+                result = {"type": "literal", "value": node.value}
+            elif node.op == SEQUENCE:
+                result = {"type": "sequence", "elements": [converted[id(e)] for e in node.elements]}
+            elif node.op == ALTERNATION:
+                result = {"type": "alternation", "options": [converted[id(o)] for o in node.options]}
+            elif node.op == CHAR_CLASS:
+                result = {"type": "class", "chars": node.chars}
+            else:
+                result = {"type": "repeat", "node": converted[id(node.node)], "min": node.min, "max": node.max}
+            converted[id(node)] = result
+        return converted[id(self)]
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class Literal(Node):
+    __slots__ = ("value",)
+    op = LITERAL
+
+    def __init__(self, value):
+        self.value = value
+
+
+class Sequence(Node):
+    __slots__ = ("elements",)
+    op = SEQUENCE
+
+    def __init__(self, elements):
+        self.elements = elements
+
+    def children(self):
+        return self.elements
+
+
+class Alternation(Node):
+    __slots__ = ("options",)
+    op = ALTERNATION
+
+    def __init__(self, options):
+        self.options = options
+
+    def children(self):
+        return self.options
+
+
+class Repeat(Node):
+    """
+    Repeats 'node' between 'min' and 'max' times; max is None for unbounded quantifiers.
+    """
+    __slots__ = ("node", "min", "max")
+    op = REPEAT
+
+    def __init__(self, node, min, max):
+        self.node = node
+        self.min = min
+        self.max = max
+
+    def children(self):
+        return (self.node,)
+
+    def upper(self, max_repeat):
+        """
+        Largest repetition count used when generating, capping unbounded repeats at max_repeat.
+        """
+        return self.max if self.max is not None else max(self.min, max_repeat)
+
+
+class CharClass(Node):
+    """
+    Matches any one character of 'chars' (a string of distinct characters).
+    """
+    __slots__ = ("chars",)
+    op = CHAR_CLASS
+
+    def __init__(self, chars):
+        self.chars = chars
+
+
+def postorder(root):
+    """
+    Returns the nodes of the tree with every child before its parent, without recursion.
+    Shared subtrees are listed once.
+    """
+    order = []
+    seen = set()
+    stack = [(root, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if expanded:
+            order.append(node)
+        elif id(node) not in seen:
+            seen.add(id(node))
+            stack.append((node, True))
+            stack.extend((child, False) for child in reversed(node.children()))
+    return order
+
+
+def node_from_dict(tree):
+    """
+    Converts a tree in the old nested-dict form back into Node objects.
+    """
+    converted = {}
+    stack = [(tree, False)]
+    while stack:
+        d, expanded = stack.pop()
+        t = d["type"]
+        if t == "sequence":
+            children = d["elements"]
+        elif t == "alternation":
+            children = d["options"]
+        elif t == "repeat":
+            children = [d["node"]]
+        elif t in ("literal", "class"):
+            children = []
+        else:
+            raise Exception("Unknown node type: " + t)
+        if not expanded:
+            stack.append((d, True))
+            stack.extend((child, False) for child in children)
+            continue
+        if t == "literal":
+            node = Literal(d["value"])
+        elif t == "class":
+            node = CharClass(d["chars"])
+        elif t == "sequence":
+            node = Sequence([converted[id(e)] for e in children])
+        elif t == "alternation":
+            node = Alternation([converted[id(o)] for o in children])
+        else:
+            node = Repeat(converted[id(d["node"])], d["min"], d["max"])
+        converted[id(d)] = node
+    return converted[id(tree)]
+
+
 def parse_expression(s, pos=0, stop_chars=set(')')):
     """
     Parses an expression which may contain concatenation and alternation (using '|').
     Returns a parse tree and the new position.
+    Groups are handled with an explicit stack of open parentheses instead of recursion,
+    so the nesting depth is not limited by Python's recursion limit.
     """
+    # One frame per open group: (alternatives, sequence) of that group.
+    frames = []
     alternatives = []
     sequence = []
-    while pos < len(s) and s[pos] not in stop_chars:
+    while pos < len(s) and (frames or s[pos] not in stop_chars):
         if s[pos] == '|':
             # End the current alternative and start a new one.
             alternatives.append(sequence_to_node(sequence))
             sequence = []
             pos += 1  # Skip the '|' character.
+        elif s[pos] == '(':
+            frames.append((alternatives, sequence))
+            alternatives, sequence = [], []
+            pos += 1  # Skip '('
+        elif s[pos] == ')':
+            if not frames:
+                break  # Unbalanced ')': leave it to the caller to report.
+            alternatives.append(sequence_to_node(sequence))
+            node = alternatives[0] if len(alternatives) == 1 else Alternation(alternatives)
+            alternatives, sequence = frames.pop()
+            node, pos = parse_quantifier(s, pos + 1, node)  # Skip ')'
+            sequence.append(node)
         else:
             node, pos = parse_atom(s, pos)
             sequence.append(node)
+    if frames:
+        raise Exception("Missing closing parenthesis")
     # Append the final alternative.
     alternatives.append(sequence_to_node(sequence))
     if len(alternatives) == 1:
         return alternatives[0], pos
     else:
-        return {"type": "alternation", "options": alternatives}, pos
+        return Alternation(alternatives), pos
 
 
 def sequence_to_node(seq):
@@ -28,59 +217,147 @@ def sequence_to_node(seq):
     If only one node is present, returns it directly.
     """
     if not seq:
-        return {"type": "literal", "value": ""}
+        return Literal("")
     if len(seq) == 1:
         return seq[0]
-    return {"type": "sequence", "elements": seq}
+    return Sequence(seq)
+
+
+# Characters with a special meaning outside character classes; escape them with a backslash.
+SPECIAL_CHARS = frozenset("()*+?|^{}[]\\")
+# Characters that start a quantifier (see parse_quantifier)
+QUANTIFIER_CHARS = frozenset("*+?^{")
 
 
 def parse_atom(s, pos):
     """
-    Parses a single atom which is either a group (in parentheses) or a literal.
-    After reading the atom, it checks for an attached quantifier (*, +, or ^number).
-    Returns the constructed node and the new position.
-    """
-    if s[pos] == '(':
-        # Parse a grouped subexpression.
-        pos += 1  # Skip '('
-        node, pos = parse_expression(s, pos, stop_chars={')'})
-        if pos >= len(s) or s[pos] != ')':
-            raise Exception("Missing closing parenthesis")
-        pos += 1  # Skip ')'
+    Parses a single atom which is either a character class ([abc], [a-z]) or a run of
+    literal characters (where '\\x' stands for a literal x); groups are handled by
+    parse_expression. After reading the atom, it checks for attached quantifiers
+    (see parse_quantifier). A quantifier applies to the single character before it, so a run
+    followed by one ends before its last character, which becomes the next atom ('colou?r' is
+    'colo', 'u?', 'r'). Returns the constructed node and the new position.
+    """
+    if s[pos] == '[':
+        node, pos = parse_char_class(s, pos)
+    elif s[pos] in '}]':
+        # A closer without its opener; escape it to match it literally.
+        raise Exception(f"Unexpected '{s[pos]}' at position {pos}")
     else:
         # Parse consecutive literal characters until a special char is encountered.
-        start = pos
-        while pos < len(s) and s[pos] not in set("()*+|^"):
+        chars = []
+        while pos < len(s) and (s[pos] == '\\' or s[pos] not in SPECIAL_CHARS):
+            width = 2 if s[pos] == '\\' else 1
+            if chars and s[pos + width:pos + width + 1] in QUANTIFIER_CHARS:
+                break  # Leave the quantified character for the next atom.
+            if s[pos] == '\\':
+                pos += 1  # Skip the backslash.
+                if pos == len(s):
+                    raise Exception("Dangling escape at end of regex")
+            chars.append(s[pos])
             pos += 1
-        literal = s[start:pos]
-        node = {"type": "literal", "value": literal}
+        node = Literal("".join(chars))
+    return parse_quantifier(s, pos, node)
 
-    # Check for quantifiers following the atom.
-    if pos < len(s):
+
+def parse_char_class(s, pos):
+    """
+    Parses a character class such as [abc], [a-z0-9] or [\\]\\-] starting at the '['.
+    Returns a CharClass node (members in order of first appearance) and the new position.
+    """
+    pos += 1  # Skip '['
+    if pos < len(s) and s[pos] == '^':
+        raise Exception("Negated character classes are not supported")
+    members = {}
+    while pos < len(s) and s[pos] != ']':
+        low, pos = _class_char(s, pos)
+        if pos + 1 < len(s) and s[pos] == '-' and s[pos + 1] != ']':
+            high, pos = _class_char(s, pos + 1)
+            if ord(high) < ord(low):
+                raise Exception(f"Invalid range {low}-{high} in character class")
+            for code in range(ord(low), ord(high) + 1):
+                members[chr(code)] = None
+        else:
+            members[low] = None
+    if pos >= len(s):
+        raise Exception("Missing closing bracket")
+    if not members:
+        raise Exception("Empty character class")
+    return CharClass("".join(members)), pos + 1  # Skip ']'
+
+
+def _class_char(s, pos):
+    if s[pos] == '\\':
+        pos += 1  # Skip the backslash.
+        if pos == len(s):
+            raise Exception("Dangling escape at end of regex")
+    return s[pos], pos + 1
+
+
+def parse_quantifier(s, pos, node):
+    """
+    Wraps the node in repeat nodes for the quantifiers that follow at 'pos':
+      - '*' zero or more, '+' one or more, '?' zero or one,
+      - '{m}', '{m,}', '{m,n}' and '{,n}' explicit bounds,
+      - '^n' exactly n repetitions.
+    Unbounded quantifiers get max=None; generation caps them with its max_repeat argument.
+    Returns the (possibly wrapped) node and the new position.
+    """
+    while pos < len(s):
         if s[pos] == '*':
-            # 0 to 5 repetitions.
-            node = {"type": "repeat", "node": node, "min": 0, "max": 5}
+            node = Repeat(node, 0, None)
             pos += 1
         elif s[pos] == '+':
-            # 1 to 5 repetitions.
-            node = {"type": "repeat", "node": node, "min": 1, "max": 5}
+            node = Repeat(node, 1, None)
+            pos += 1
+        elif s[pos] == '?':
+            node = Repeat(node, 0, 1)
             pos += 1
         elif s[pos] == '^':
             # Exact repetition as specified by the number following '^'.
             pos += 1  # Skip '^'
-            num_start = pos
-            while pos < len(s) and s[pos].isdigit():
-                pos += 1
-            if num_start == pos:
+            number, pos = _parse_number(s, pos)
+            if number is None:
                 raise Exception("Expected number after '^'")
-            number = int(s[num_start:pos])
-            node = {"type": "repeat", "node": node, "min": number, "max": number}
+            node = Repeat(node, number, number)
+        elif s[pos] == '{':
+            low, pos = _parse_number(s, pos + 1)
+            if pos < len(s) and s[pos] == ',':
+                high, pos = _parse_number(s, pos + 1)
+                if low is None and high is None:
+                    raise Exception("Expected a bound in '{,}'")
+            elif low is None:
+                raise Exception("Expected number after '{'")
+            else:
+                high = low
+            if pos >= len(s) or s[pos] != '}':
+                raise Exception("Missing closing brace")
+            pos += 1  # Skip '}'
+            low = low or 0
+            if high is not None and high < low:
+                raise Exception(f"Invalid repetition bounds {{{low},{high}}}")
+            node = Repeat(node, low, high)
+        else:
+            break
     return node, pos
 
 
+def _parse_number(s, pos):
+    """
+    Reads a decimal number at 'pos'. Returns (number or None, new position).
+    """
+    start = pos
+    while pos < len(s) and s[pos].isdigit():
+        pos += 1
+    if start == pos:
+        return None, pos
+    return int(s[start:pos]), pos
+
+
 def parse_regex(s):
     """
-    Top-level regex parser. Returns the parse tree.
+    Top-level regex parser. Returns the parse tree as Node objects
+    (use tree.to_dict() for the old nested-dict form).
     """
     tree, pos = parse_expression(s, 0, stop_chars=set())
     if pos != len(s):
@@ -88,140 +365,911 @@ def parse_regex(s):
     return tree
 
 
-def generate_from_tree(node):
-    """
-    Recursively generates all strings that match the parsed regex node.
-    """
-    t = node["type"]
-    if t == "literal":
-        return [node["value"]]
-    elif t == "sequence":
-        result = [""]
-        for elem in node["elements"]:
-            new_result = []
-            subs = generate_from_tree(elem)
-            for prefix in result:
-                for sub in subs:
-                    new_result.append(prefix + sub)
-            result = new_result
-        return result
-    elif t == "alternation":
-        results = []
-        for option in node["options"]:
-            results.extend(generate_from_tree(option))
-        return results
-    elif t == "repeat":
-        subs = generate_from_tree(node["node"])
-        results = []
-        for count in range(node["min"], node["max"] + 1):
-            if count == 0:
-                results.append("")
+def generate_from_tree(node, max_repeat=5):
+    """
+    Generates all strings that match the parsed regex node.
+    Unbounded repeats (*, +, {m,}) are generated up to max_repeat times.
+    Nodes are evaluated children-first from postorder(), so deep trees need no recursion.
+    """
+    results = {}
+    for current in postorder(node):
+        op = current.op
+        if op == LITERAL:
+            result = [current.value]
+        elif op == CHAR_CLASS:
+            result = list(current.chars)
+        elif op == SEQUENCE:
+            result = [""]
+            for elem in current.elements:
+                subs = results[id(elem)]
+                result = [prefix + sub for prefix in result for sub in subs]
+        elif op == ALTERNATION:
+            result = []
+            for option in current.options:
+                result.extend(results[id(option)])
+        elif op == REPEAT:
+            subs = results[id(current.node)]
+            result = []
+            temp = [""]
+            upper = current.upper(max_repeat)
+            for count in range(upper + 1):
+                if count >= current.min:
+                    result.extend(temp)
+                if count < upper:
+                    temp = [prefix + sub for prefix in temp for sub in subs]
+        else:
+            raise Exception(f"Unknown node type: {current!r}")
+        results[id(current)] = result
+    return results[id(node)]
+
+
+def iter_from_tree(node, prefix="", max_repeat=5):
+    """
+    Lazily yields all strings that match the parsed regex node, each one prefixed
+    with 'prefix'. The order is the same as generate_from_tree (in a sequence the
+    first element varies slowest), but strings are produced one at a time.
+    The tree is walked depth-first with an explicit stack instead of nested generators,
+    so neither nesting depth nor the number of repeat copies is limited by recursion.
+    Each stack entry is a pending choice: the prefix built so far and the nodes still
+    to be matched after it, as a linked list of (node, rest) cells shared between entries.
+    """
+    stack = [(prefix, (node, None))]
+    while stack:
+        prefix, pending = stack.pop()
+        while pending is not None:
+            current, pending = pending
+            op = current.op
+            if op == LITERAL:
+                prefix += current.value
+            elif op == CHAR_CLASS:
+                for ch in reversed(current.chars[1:]):
+                    stack.append((prefix + ch, pending))
+                prefix += current.chars[0]
+            elif op == SEQUENCE:
+                for elem in reversed(current.elements):
+                    pending = (elem, pending)
+            elif op == ALTERNATION:
+                for option in reversed(current.options[1:]):
+                    stack.append((prefix, (option, pending)))
+                pending = (current.options[0], pending)
+            elif op == REPEAT:
+                # One continuation per allowed count, each one copy longer than the last.
+                choices = []
+                rest = pending
+                for count in range(current.upper(max_repeat) + 1):
+                    if count >= current.min:
+                        choices.append(rest)
+                    rest = (current.node, rest)
+                for choice in reversed(choices[1:]):
+                    stack.append((prefix, choice))
+                pending = choices[0]
             else:
-                temp = [""]
-                for _ in range(count):
-                    new_temp = []
-                    for prefix in temp:
-                        for sub in subs:
-                            new_temp.append(prefix + sub)
-                    temp = new_temp
-                results.extend(temp)
-        return results
-    else:
-        raise Exception("Unknown node type: " + t)
+                raise Exception(f"Unknown node type: {current!r}")
+        yield prefix
 
 
-def generate_valid_from_regex(regex):
+def generate_valid_from_regex(regex, distinct=False, max_repeat=5):
     """
     Given a regex string, parse it into a tree and generate all valid strings.
+    Unbounded repeats are generated up to max_repeat times.
+    With distinct=True every string appears once, in shortlex order (see iter_valid_from_regex).
     """
-    tree = parse_regex(regex)
-    return generate_from_tree(tree)
+    if distinct:
+        return list(regex_cache.compile(regex, max_repeat).iter_shortlex())
+    tree = regex_cache.parse(regex)
+    return generate_from_tree(tree, max_repeat)
 
 
-# --- Dynamic Sequence Processing (Step-by-Step Matching) --- #
+def iter_valid_from_regex(regex, limit=None, offset=0, distinct=False, max_repeat=5):
+    """
+    Streaming version of generate_valid_from_regex.
+    Skips the first 'offset' strings and yields at most 'limit' strings
+    (all of them when limit is None) without building the full language.
+    With distinct=True the strings come from the minimized DFA in shortlex order
+    (shorter strings first, equal lengths sorted), so no duplicates are produced
+    and no set of already seen strings is kept.
+    """
+    if offset < 0 or (limit is not None and limit < 0):
+        raise ValueError("limit and offset must be non-negative")
+    stop = None if limit is None else offset + limit
+    if distinct:
+        return islice(regex_cache.compile(regex, max_repeat).iter_shortlex(), offset, stop)
+    tree = regex_cache.parse(regex)
+    return islice(iter_from_tree(tree, max_repeat=max_repeat), offset, stop)
 
-def process_node(node, string, pos):
+
+def shortlex_key(s):
+    """
+    Sort key of the shortlex order used by the distinct generators.
     """
-    Recursively processes the parse tree node against the given string starting at 'pos'.
-    Returns a tuple (explanation, new_pos, success), where:
-      - explanation is a list of strings detailing the processing steps,
-      - new_pos is the updated position in the string,
-      - success is a boolean indicating a successful match.
+    return len(s), s
+
+
+def merge_shortlex(*streams):
     """
-    explanation = []
-    node_type = node["type"]
+    Merges shortlex-sorted streams (e.g. from several patterns) into one sorted stream,
+    dropping strings that occur in more than one input.
+    """
+    previous = None
+    for s in heapq.merge(*streams, key=shortlex_key):
+        if s != previous:
+            yield s
+            previous = s
+
+
+# --- Counting the Generated Language --- #
+
+def count_from_tree(node, distinct=False, max_repeat=5):
+    """
+    Counts the strings that generate_from_tree would produce for the node, without generating them.
+    With distinct=False duplicates are counted too, so the result equals len(generate_from_tree(node)).
+    With distinct=True every string is counted once, which is done by counting the accepting paths
+    of the DFA for the node. Unbounded repeats are counted up to max_repeat times.
+    """
+    if distinct:
+        return count_dfa_paths(nfa_to_dfa(build_nfa(node, max_repeat)))
+    return node_sizes(node, max_repeat=max_repeat)[id(node)]
+
 
-    if node_type == "literal":
-        literal = node["value"]
-        if string.startswith(literal, pos):
-            explanation.append(f"Matched literal '{literal}' at position {pos}")
-            return explanation, pos + len(literal), True
+def _repeat_count(inner, low, high):
+    """
+    Closed form of inner^low + inner^(low+1) + ... + inner^high.
+    """
+    if low > high:
+        return 0
+    if inner == 0:
+        return 1 if low == 0 else 0
+    if inner == 1:
+        return high - low + 1
+    return (inner ** (high + 1) - inner ** low) // (inner - 1)
+
+
+def count_valid_from_regex(regex, distinct=False, max_repeat=5):
+    """
+    Given a regex string, returns the number of valid strings without generating them.
+    """
+    return count_from_tree(regex_cache.parse(regex), distinct, max_repeat)
+
+
+# --- Random Access and Sampling --- #
+
+def node_sizes(node, sizes=None, max_repeat=5):
+    """
+    Returns a dict mapping id(node) to the number of strings each node of the tree generates
+    (duplicates included), so unranking never has to recount a subtree.
+    """
+    if sizes is None:
+        sizes = {}
+    for current in postorder(node):
+        op = current.op
+        if op == LITERAL:
+            size = 1
+        elif op == CHAR_CLASS:
+            size = len(current.chars)
+        elif op == SEQUENCE:
+            size = 1
+            for elem in current.elements:
+                size *= sizes[id(elem)]
+        elif op == ALTERNATION:
+            size = sum(sizes[id(option)] for option in current.options)
+        elif op == REPEAT:
+            size = _repeat_count(sizes[id(current.node)], current.min, current.upper(max_repeat))
         else:
-            return [f"Failed to match literal '{literal}' at position {pos}"], pos, False
-
-    elif node_type == "sequence":
-        for i, elem in enumerate(node["elements"]):
-            exp_elem, new_pos, success = process_node(elem, string, pos)
-            explanation.extend(exp_elem)
-            if not success:
-                return explanation, new_pos, False
-            pos = new_pos
-        return explanation, pos, True
-
-    elif node_type == "alternation":
-        # Attempt each alternative.
-        alt_explanations = []
-        for option in node["options"]:
-            exp_option, new_pos, success = process_node(option, string, pos)
-            if success:
-                explanation.append(f"Matched alternation option at position {pos}")
-                explanation.extend(exp_option)
-                return explanation, new_pos, True
+            raise Exception(f"Unknown node type: {current!r}")
+        sizes[id(current)] = size
+    return sizes
+
+
+def nth_from_tree(node, k, sizes=None, max_repeat=5):
+    """
+    Returns generate_from_tree(node, max_repeat)[k] without generating the strings before it.
+    'sizes' is the table from node_sizes (built with the same max_repeat); pass it in when
+    unranking many indices.
+    Sequences and repeats are mixed-radix numbers whose first digit is the most significant.
+    """
+    if sizes is None:
+        sizes = node_sizes(node, max_repeat=max_repeat)
+    total = sizes[id(node)]
+    if k < 0:
+        k += total
+    if not 0 <= k < total:
+        raise IndexError("string index out of range")
+    pieces = []
+    # Work list of (node, index) pairs, popped left to right in output order.
+    stack = [(node, k)]
+    while stack:
+        current, k = stack.pop()
+        op = current.op
+        if op == LITERAL:
+            pieces.append(current.value)
+        elif op == CHAR_CLASS:
+            pieces.append(current.chars[k])
+        elif op == SEQUENCE:
+            stack.extend(_digits(current.elements, k, sizes))
+        elif op == ALTERNATION:
+            for option in current.options:
+                size = sizes[id(option)]
+                if k < size:
+                    stack.append((option, k))
+                    break
+                k -= size
+        elif op == REPEAT:
+            inner = sizes[id(current.node)]
+            for count in range(current.min, current.upper(max_repeat) + 1):
+                block = inner ** count
+                if k < block:
+                    stack.extend(_digits([current.node] * count, k, sizes))
+                    break
+                k -= block
+        else:
+            raise Exception(f"Unknown node type: {current!r}")
+    return "".join(pieces)
+
+
+def _digits(elements, k, sizes):
+    """
+    Splits k into one digit per element (radix = element size).
+    Returns (element, digit) pairs last element first, ready to be pushed on a stack.
+    """
+    pairs = []
+    for elem in reversed(elements):
+        k, digit = divmod(k, sizes[id(elem)])
+        pairs.append((elem, digit))
+    return pairs
+
+
+def nth_string(regex, k, max_repeat=5):
+    """
+    Given a regex string, returns the k-th string of generate_valid_from_regex(regex, max_repeat=max_repeat).
+    """
+    tree, sizes = regex_cache.sizes(regex, max_repeat)
+    return nth_from_tree(tree, k, sizes, max_repeat)
+
+
+def sample(regex, n, seed=None, max_repeat=5):
+    """
+    Draws n strings uniformly at random (without replacement of indices) from the strings
+    generated for the regex. The same seed always gives the same sample.
+    """
+    tree, sizes = regex_cache.sizes(regex, max_repeat)
+    total = sizes[id(tree)]
+    if not 0 <= n <= total:
+        raise ValueError(f"Sample size {n} is outside the language size {total}")
+    rng = random.Random(seed)
+    if 2 * n > total:
+        # Dense sample: the language is small, so shuffling its indices is cheap.
+        indices = rng.sample(range(total), n)
+    else:
+        # Sparse sample: draw indices and reject the few repeats.
+        indices = []
+        seen = set()
+        while len(indices) < n:
+            index = rng.randrange(total)
+            if index not in seen:
+                seen.add(index)
+                indices.append(index)
+    return [nth_from_tree(tree, index, sizes, max_repeat) for index in indices]
+
+
+# --- Automata Construction --- #
+
+class NFA:
+    """
+    Thompson NFA. States are integers; 'eps' holds the epsilon targets of each state and
+    'moves' holds (char, target) pairs. The automaton has a single start and accept state.
+    """
+
+    def __init__(self):
+        self.eps = []
+        self.moves = []
+        self.start = None
+        self.accept = None
+
+    def new_state(self):
+        self.eps.append([])
+        self.moves.append([])
+        return len(self.eps) - 1
+
+
+def build_nfa(node, max_repeat=None):
+    """
+    Builds a Thompson NFA for the node. With max_repeat=None unbounded repeats become loops
+    and the NFA accepts the full language (this is what the matcher uses); with a number
+    they are unrolled like in generation, so the NFA accepts exactly the generated strings.
+    """
+    nfa = NFA()
+    nfa.start, nfa.accept = _build_fragment(nfa, node, max_repeat)
+    return nfa
+
+
+def _build_fragment(nfa, node, max_repeat):
+    """
+    Adds the states for the tree to the NFA and returns its (entry, exit) states.
+    The tree is walked children-first with an explicit stack; finished fragments are kept
+    on a value stack, so every occurrence of a node gets its own states. A repeat node
+    pushes its child once per copy it needs, and each copy is built afresh.
+    """
+    fragments = []
+    stack = [(node, False)]
+    while stack:
+        current, expanded = stack.pop()
+        op = current.op
+        if op == LITERAL:
+            entry = state = nfa.new_state()
+            for ch in current.value:
+                target = nfa.new_state()
+                nfa.moves[state].append((ch, target))
+                state = target
+            fragments.append((entry, state))
+        elif op == CHAR_CLASS:
+            entry, exit_ = nfa.new_state(), nfa.new_state()
+            nfa.moves[entry].extend((ch, exit_) for ch in current.chars)
+            fragments.append((entry, exit_))
+        elif not expanded:
+            stack.append((current, True))
+            if op == REPEAT:
+                stack.extend((current.node, False) for _ in range(_repeat_copies(current, max_repeat)))
             else:
-                alt_explanations.append(exp_option)
-        explanation.append(f"Failed to match any alternation option at position {pos}")
-        explanation.extend(sum(alt_explanations, []))
-        return explanation, pos, False
-
-    elif node_type == "repeat":
-        count = 0
-        all_explanations = []
-        current_pos = pos
-        # Try greedy matching up to 'max' times.
-        while count < node["max"]:
-            exp_inner, new_pos, success = process_node(node["node"], string, current_pos)
-            if success and new_pos > current_pos:  # Ensure progress is made.
-                all_explanations.extend(exp_inner)
-                count += 1
-                current_pos = new_pos
+                stack.extend((child, False) for child in reversed(current.children()))
+        elif op == SEQUENCE:
+            parts = _pop_fragments(fragments, len(current.elements))
+            entry, state = parts[0]
+            for part_entry, part_exit in parts[1:]:
+                nfa.eps[state].append(part_entry)
+                state = part_exit
+            fragments.append((entry, state))
+        elif op == ALTERNATION:
+            parts = _pop_fragments(fragments, len(current.options))
+            entry, exit_ = nfa.new_state(), nfa.new_state()
+            for part_entry, part_exit in parts:
+                nfa.eps[entry].append(part_entry)
+                nfa.eps[part_exit].append(exit_)
+            fragments.append((entry, exit_))
+        elif op == REPEAT:
+            parts = _pop_fragments(fragments, _repeat_copies(current, max_repeat))
+            fragments.append(_link_repeat(nfa, current, max_repeat, parts))
+        else:
+            raise Exception(f"Unknown node type: {current!r}")
+    return fragments[0]
+
+
+def _pop_fragments(fragments, count):
+    """
+    Removes the last 'count' fragments from the value stack and returns them in order.
+    """
+    start = len(fragments) - count
+    parts = fragments[start:]
+    del fragments[start:]
+    return parts
+
+
+def _repeat_copies(node, max_repeat):
+    """
+    Number of copies of the child that the NFA of a repeat node needs.
+    """
+    if node.max is None and max_repeat is None:
+        return node.min + 1  # 'min' mandatory copies and one inside the Kleene loop.
+    return node.upper(max_repeat)
+
+
+def _link_repeat(nfa, node, max_repeat, parts):
+    """
+    Connects the already built copies of a repeat node's child and returns its (entry, exit).
+    """
+    entry = current = nfa.new_state()
+    exit_ = nfa.new_state()
+    if node.max is None and max_repeat is None:
+        # 'min' mandatory copies followed by a Kleene loop over one more copy.
+        for copy_entry, copy_exit in parts[:-1]:
+            nfa.eps[current].append(copy_entry)
+            current = copy_exit
+        loop = nfa.new_state()
+        nfa.eps[current].append(loop)
+        copy_entry, copy_exit = parts[-1]
+        nfa.eps[loop].extend((copy_entry, exit_))
+        nfa.eps[copy_exit].append(loop)
+        return entry, exit_
+    # Unrolled copies; every copy after the first 'min' may be skipped.
+    for count, (copy_entry, copy_exit) in enumerate(parts):
+        if count >= node.min:
+            nfa.eps[current].append(exit_)
+        nfa.eps[current].append(copy_entry)
+        current = copy_exit
+    nfa.eps[current].append(exit_)
+    return entry, exit_
+
+
+def _epsilon_closure(nfa, states):
+    """
+    Returns the frozenset of NFA states reachable from 'states' through epsilon moves.
+    """
+    closure = set(states)
+    stack = list(states)
+    while stack:
+        for target in nfa.eps[stack.pop()]:
+            if target not in closure:
+                closure.add(target)
+                stack.append(target)
+    return frozenset(closure)
+
+
+def nfa_to_dfa(nfa):
+    """
+    Subset construction. Returns (transitions, accepting) where transitions[state] maps a
+    character to the next DFA state and accepting[state] tells whether the state accepts.
+    DFA state 0 is the start state; missing transitions mean rejection.
+    """
+    start = _epsilon_closure(nfa, [nfa.start])
+    index = {start: 0}
+    subsets = [start]
+    transitions = []
+    accepting = []
+    for subset in subsets:  # 'subsets' grows while we iterate over it.
+        targets = {}
+        for state in subset:
+            for ch, target in nfa.moves[state]:
+                targets.setdefault(ch, set()).add(target)
+        row = {}
+        for ch in sorted(targets):
+            closure = _epsilon_closure(nfa, targets[ch])
+            if closure not in index:
+                index[closure] = len(subsets)
+                subsets.append(closure)
+            row[ch] = index[closure]
+        transitions.append(row)
+        accepting.append(nfa.accept in subset)
+    return transitions, accepting
+
+
+def count_dfa_paths(dfa):
+    """
+    Counts the distinct strings accepted by an acyclic DFA by summing accepting paths
+    in reverse topological order.
+    """
+    transitions, accepting = dfa
+    counts = [None] * len(transitions)
+    stack = [0]
+    while stack:
+        state = stack[-1]
+        pending = [t for t in transitions[state].values() if counts[t] is None]
+        if pending:
+            stack.extend(pending)
+            continue
+        stack.pop()
+        if counts[state] is None:
+            counts[state] = int(accepting[state]) + sum(counts[t] for t in transitions[state].values())
+    return counts[0]
+
+
+def minimize_dfa(dfa):
+    """
+    Minimizes a DFA from nfa_to_dfa by Moore partition refinement.
+    Returns (transitions, accepting, start) in the same format, where missing transitions
+    still mean rejection and states that can never accept are dropped.
+    """
+    transitions, accepting = dfa
+    alphabet = sorted({ch for row in transitions for ch in row})
+    # Complete the automaton with an explicit dead state so every state has a full row.
+    dead = len(transitions)
+    rows = [[row.get(ch, dead) for ch in alphabet] for row in transitions]
+    rows.append([dead] * len(alphabet))
+    finals = list(accepting) + [False]
+
+    block = [int(final) for final in finals]
+    block_count = len(set(block))
+    while True:
+        signatures = {}
+        new_block = [signatures.setdefault((block[s], tuple(block[t] for t in rows[s])), len(signatures))
+                     for s in range(len(rows))]
+        if len(signatures) == block_count:
+            break
+        block, block_count = new_block, len(signatures)
+
+    # Renumber the blocks in breadth-first order from the start, skipping the dead block.
+    dead_block = block[dead]
+    number = {block[0]: 0}
+    order = [0]
+    min_transitions = []
+    min_accepting = []
+    for state in order:  # 'order' grows while we iterate over it.
+        row = {}
+        for ch, target in zip(alphabet, rows[state]):
+            target_block = block[target]
+            if target_block == dead_block:
+                continue
+            if target_block not in number:
+                number[target_block] = len(order)
+                order.append(target)
+            row[ch] = number[target_block]
+        min_transitions.append(row)
+        min_accepting.append(finals[state])
+    return min_transitions, min_accepting, 0
+
+
+class CompiledRegex:
+    """
+    Minimized DFA with a flat integer transition table.
+    Each state is stored as its row offset in 'table', so one step is a single index:
+    state = table[state + column], where column 0 is used for characters outside the
+    pattern's alphabet. Offset 0 is the dead state.
+    """
+
+    def __init__(self, pattern, dfa):
+        transitions, accepting, start = minimize_dfa(dfa)
+        self.pattern = pattern
+        self.alphabet = sorted({ch for row in transitions for ch in row})
+        self.columns = {ch: column for column, ch in enumerate(self.alphabet, start=1)}
+        self.width = len(self.alphabet) + 1
+        self.state_count = len(transitions)
+        # Row 0 is the dead state, DFA state i lives in row i + 1.
+        self.table = array('i', [0]) * (self.width * (self.state_count + 1))
+        self.accepting = bytearray(len(self.table))
+        for state, row in enumerate(transitions):
+            offset = (state + 1) * self.width
+            for ch, target in row.items():
+                self.table[offset + self.columns[ch]] = (target + 1) * self.width
+            self.accepting[offset] = accepting[state]
+        self.start = (start + 1) * self.width
+
+    def match(self, string):
+        """
+        Returns True if the whole string is in the language of the pattern.
+        """
+        table = self.table
+        column = self.columns.get
+        state = self.start
+        for ch in string:
+            state = table[state + column(ch, 0)]
+            if not state:
+                return False
+        return self.accepting[state] == 1
+
+    def trace(self, string):
+        """
+        Slow path of match that also explains every transition.
+        Returns (success, explanation) with the explanation as a list of strings.
+        """
+        explanation = []
+        state = self.start
+        for pos, ch in enumerate(string):
+            target = self.table[state + self.columns.get(ch, 0)]
+            if not target:
+                explanation.append(f"No transition for '{ch}' from state {state // self.width - 1} at position {pos}")
+                explanation.append("Matching failed.")
+                return False, explanation
+            explanation.append(f"Read '{ch}' at position {pos}: state {state // self.width - 1} -> {target // self.width - 1}")
+            state = target
+        if self.accepting[state]:
+            explanation.append("String fully matched the regex!")
+            return True, explanation
+        explanation.append(f"Input ended in non-accepting state {state // self.width - 1}.")
+        explanation.append("Matching failed.")
+        return False, explanation
+
+    def is_finite(self):
+        """
+        Returns True if the language is finite, i.e. the minimized DFA has no cycle
+        (the minimized DFA only keeps states that can still reach acceptance).
+        """
+        width = self.width
+        # 0 = unvisited, 1 = on the current path, 2 = done.
+        color = bytearray(len(self.table) // width)
+        stack = [(self.start, 1)]
+        color[self.start // width] = 1
+        while stack:
+            state, column = stack.pop()
+            if column == width:
+                color[state // width] = 2
+                continue
+            stack.append((state, column + 1))
+            target = self.table[state + column]
+            if not target:
+                continue
+            if color[target // width] == 1:
+                return False
+            if not color[target // width]:
+                color[target // width] = 1
+                stack.append((target, 1))
+        return True
+
+    def _accepting_lengths(self, max_length):
+        """
+        Maps every state offset to a bitmask whose bit n is set when an accepting state is
+        reachable in exactly n more characters (only bits up to max_length, if given).
+        """
+        width = self.width
+        states = range(width, len(self.table), width)
+        mask = -1 if max_length is None else (1 << (max_length + 1)) - 1
+        lengths = {0: 0}
+        for state in states:
+            lengths[state] = self.accepting[state]
+        changed = True
+        while changed:
+            changed = False
+            for state in states:
+                bits = self.accepting[state]
+                for column in range(1, width):
+                    bits |= lengths[self.table[state + column]] << 1
+                bits &= mask
+                if bits != lengths[state]:
+                    lengths[state] = bits
+                    changed = True
+        return lengths
+
+    def iter_shortlex(self, max_length=None):
+        """
+        Yields every string of the language exactly once in shortlex order.
+        Each length is enumerated by a depth-first walk that only follows transitions
+        which can still reach an accepting state in the remaining number of characters,
+        so no work is wasted on dead branches.
+        """
+        if max_length is None and not self.is_finite():
+            raise ValueError("The language is infinite; pass max_length or compile with max_repeat")
+        lengths = self._accepting_lengths(max_length)
+        table = self.table
+        columns = range(len(self.alphabet), 0, -1)
+        available = lengths[self.start]
+        length = 0
+        while available >> length:
+            if available >> length & 1:
+                stack = [(self.start, length, "")]
+                while stack:
+                    state, remaining, prefix = stack.pop()
+                    if not remaining:
+                        yield prefix
+                        continue
+                    # Push in reverse so the smallest character is expanded first.
+                    for column in columns:
+                        target = table[state + column]
+                        if lengths[target] >> (remaining - 1) & 1:
+                            stack.append((target, remaining - 1, prefix + self.alphabet[column - 1]))
+            length += 1
+
+
+def compile_tree(node, pattern=None, max_repeat=None):
+    """
+    Compiles a parse tree into a CompiledRegex (Thompson NFA -> subset construction -> minimization).
+    Matchers use max_repeat=None so unbounded quantifiers really are unbounded; the distinct
+    generators compile with their max_repeat to get the finite generated language instead.
+    """
+    return CompiledRegex(pattern, nfa_to_dfa(build_nfa(node, max_repeat)))
+
+
+def compile_regex(regex, max_repeat=None):
+    """
+    Given a regex string, returns its CompiledRegex (shared through regex_cache).
+    """
+    return regex_cache.compile(regex, max_repeat)
+
+
+def match_regex(regex, string):
+    """
+    Returns True if the whole string matches the regex, using the compiled matcher.
+    """
+    return compile_regex(regex).match(string)
+
+
+# --- Bulk Matching --- #
+
+def match_many(regex, strings, processes=None, chunksize=10000):
+    """
+    Matches every string of an iterable against one regex, compiling it only once.
+    'regex' may be a regex string or a CompiledRegex, and the strings may be str or bytes
+    (bytes are decoded as UTF-8). Returns a bytearray with 1 for a match and 0 otherwise,
+    in input order. With processes > 1 the input is split into chunks of 'chunksize'
+    strings that are matched in a process pool; only a few chunks are in flight at once,
+    so the input is still streamed. The compiled matcher is sent to each worker once, when
+    it starts, and only the chunks are sent per task.
+    """
+    compiled = regex if isinstance(regex, CompiledRegex) else compile_regex(regex)
+    if not processes or processes == 1:
+        return _match_chunk(compiled, strings)
+    results = bytearray()
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(compiled,)) as pool:
+        pending = deque()
+        for chunk in _chunked(strings, chunksize):
+            pending.append(pool.submit(_match_worker_chunk, chunk))
+            if len(pending) >= 2 * processes:
+                results += pending.popleft().result()
+        while pending:
+            results += pending.popleft().result()
+    return results
+
+
+# Matcher of a match_many worker process, set once per worker by _init_worker.
+_worker_compiled = None
+
+
+def _init_worker(compiled):
+    global _worker_compiled
+    _worker_compiled = compiled
+
+
+def _match_worker_chunk(strings):
+    """
+    Matches a batch of strings in a worker process against its matcher.
+    """
+    return _match_chunk(_worker_compiled, strings)
+
+
+def _match_chunk(compiled, strings):
+    """
+    Matches a batch of strings in the current process.
+    """
+    match = compiled.match
+    results = bytearray()
+    append = results.append
+    for s in strings:
+        if isinstance(s, (bytes, bytearray)):
+            s = s.decode("utf-8")
+        append(match(s))
+    return results
+
+
+def _chunked(iterable, size):
+    """
+    Splits an iterable into lists of at most 'size' items.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_lines(source):
+    """
+    Yields the lines of a file path or of a bytes, bytearray or mmap buffer as bytes,
+    without their line endings. Files are memory-mapped instead of read into memory.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                yield from iter_lines(buffer)
+        return
+    pos = 0
+    end_of_buffer = len(source)
+    while pos < end_of_buffer:
+        end = source.find(b"\n", pos)
+        if end == -1:
+            end = end_of_buffer
+        yield source[pos:end].rstrip(b"\r")
+        pos = end + 1
+
+
+def match_file(regex, source, processes=None, chunksize=10000):
+    """
+    Matches every line of a file (or buffer, see iter_lines) against the regex.
+    """
+    return match_many(regex, iter_lines(source), processes, chunksize)
+
+
+# --- Pattern Cache --- #
+
+class RegexCache:
+    """
+    Bounded, thread-safe LRU cache of parse trees, node size tables and compiled matchers,
+    keyed by the regex text. Every entry point of this module goes through the shared
+    'regex_cache' instance, so each pattern is parsed and compiled once per process.
+    Cached trees are shared between callers and must not be modified.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def parse(self, regex):
+        """
+        Returns the parse tree of the regex.
+        """
+        return self._lookup(regex, "tree", lambda: parse_regex(regex))
+
+    def _parse_uncounted(self, regex):
+        """
+        parse() for the builders of the other fields: it shares the cached tree but leaves
+        the statistics alone, so they count one hit or miss per call a caller made.
+        """
+        return self._lookup(regex, "tree", lambda: parse_regex(regex), counted=False)
+
+    def sizes(self, regex, max_repeat=5):
+        """
+        Returns (tree, table): a parse tree of the regex and its node_sizes table for the
+        given max_repeat. The table is keyed by the id() of that tree's nodes, so the two are
+        cached together; a tree from a separate parse() call may be a different object.
+        """
+        def build():
+            tree = self._parse_uncounted(regex)
+            return tree, node_sizes(tree, max_repeat=max_repeat)
+        return self._lookup(regex, ("sizes", max_repeat), build)
+
+    def compile(self, regex, max_repeat=None):
+        """
+        Returns the CompiledRegex of the regex (see compile_tree for max_repeat).
+        """
+        return self._lookup(regex, ("compiled", max_repeat),
+                            lambda: compile_tree(self._parse_uncounted(regex), regex, max_repeat))
+
+    def _lookup(self, regex, field, build, counted=True):
+        with self._lock:
+            entry = self._entries.get(regex)
+            if entry is not None and field in entry:
+                self._entries.move_to_end(regex)
+                if counted:
+                    self.hits += 1
+                return entry[field]
+            if counted:
+                self.misses += 1
+        # Build outside the lock so a slow compilation does not block other patterns.
+        value = build()
+        with self._lock:
+            entry = self._entries.get(regex)
+            if entry is None:
+                entry = self._entries[regex] = {}
             else:
-                break
-        if count < node["min"]:
-            all_explanations.append(f"Repeat failed: expected at least {node['min']} matches but got {count} at position {pos}")
-            return all_explanations, current_pos, False
-        all_explanations.append(f"Matched repeat node {count} times from position {pos} to {current_pos}")
-        return all_explanations, current_pos, True
+                self._entries.move_to_end(regex)
+            value = entry.setdefault(field, value)
+            self._evict()
+        return value
 
-    else:
-        return [f"Unknown node type: {node_type}"], pos, False
+    def _evict(self):
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def resize(self, maxsize):
+        """
+        Changes the maximum number of cached patterns, evicting the oldest ones if needed.
+        """
+        with self._lock:
+            self.maxsize = maxsize
+            self._evict()
+
+    def clear(self):
+        """
+        Drops every cached pattern and resets the statistics.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
 
+    def info(self):
+        """
+        Returns the cache statistics as a dict.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+            }
+
+
+regex_cache = RegexCache()
+
+
+# --- Dynamic Sequence Processing (Step-by-Step Matching) --- #
 
 def dynamic_sequence_processing(regex, string):
     """
     Dynamically processes the given regex against the test string,
     producing a step-by-step explanation of the matching process.
+    The explanation is the trace of the compiled matcher (see CompiledRegex.trace),
+    so it always agrees with match_regex; only this slow path builds the strings.
     """
     try:
-        tree = parse_regex(regex)
+        compiled = compile_regex(regex)
     except Exception as e:
         return f"Regex parsing error: {e}"
-    explanation, pos, success = process_node(tree, string, 0)
-    if not success:
-        explanation.append("Matching failed.")
-    elif pos < len(string):
-        explanation.append(f"Extra characters remain after position {pos}.")
-    else:
-        explanation.append("String fully matched the regex!")
+    success, explanation = compiled.trace(string)
     return "\n".join(explanation)
 
 if __name__ == "__main__":
@@ -236,11 +1284,11 @@ if __name__ == "__main__":
     for i, regex in enumerate(regex_list, start=1):
         print(f"===== Expression {i}: {regex} =====")
         try:
-            valid_strings = generate_valid_from_regex(regex)
             print("First 10 strings:")
-            for s in valid_strings[:10]:
+            for s in iter_valid_from_regex(regex, limit=10):
                 print(s)
-            print("Total count:", len(valid_strings))
+            print("Total count:", count_valid_from_regex(regex))
+            print("Distinct count:", count_valid_from_regex(regex, distinct=True))
         except Exception as e:
             print(f"Error generating strings for {regex}: {e}")
         print("\n")
@@ -0,0 +1,259 @@
+"""
+Benchmark runner for the CNF conversion in main.py.
+
+Builds synthetic chain grammars A0 → A1 | aA1, A1 → A2 | aA2, ..., An → ε | a and times the
+nullable / productive / accessible analyses for growing n.
+The rules are listed from A0 down, which is the worst order for a repeat-until-no-change
+fixpoint: it only discovers one new symbol per pass. The worklist versions should keep a
+roughly constant time per non-terminal while the naive loop grows linearly with n.
+
+It also converts S → A1 A2 ... Ak, Ai → a | ε to CNF for growing k, once with the default
+step order and once with binarize_first=True, to show the 2^k against O(k) output size.
+
+Finally it converts random grammars (see random_grammar) of growing size with both step
+orders and reports time and output size next to their growth since the previous size:
+when the grammar doubles, a linear step keeps both growth factors near 2x.
+
+Usage:
+    python benchmark.py                       # print a table
+    python benchmark.py --sizes 100 200 400   # choose the chain lengths
+    python benchmark.py --lengths 4 8 12      # choose the long production lengths
+    python benchmark.py --only random --random-sizes 100 200 --unit-depth 4
+    python benchmark.py --json results.json   # also write the results as JSON
+"""
+import argparse
+import json
+import platform
+import random
+import time
+
+from main import Grammar, EPSILON
+
+SECTIONS = ("chains", "lengths", "random")
+
+
+def chain_grammar(n):
+    """A0 → A1 | aA1, ..., An → ε | a, with start symbol A0."""
+    names = [f"A{i}" for i in range(n + 1)]
+    rules = {}
+    for nt, nxt in zip(names, names[1:]):
+        rules[nt] = [(nxt,), ('a', nxt)]
+    rules[names[-1]] = [EPSILON, 'a']
+    return Grammar(names, ['a', EPSILON], rules, start=names[0])
+
+
+def long_production_grammar(k):
+    """S → A1 A2 ... Ak with every Ai → a | ε."""
+    names = [f"A{i}" for i in range(1, k + 1)]
+    rules = {'S': [tuple(names)]}
+    for nt in names:
+        rules[nt] = ['a', EPSILON]
+    return Grammar(['S'] + names, ['a'], rules)
+
+
+def random_grammar(size, productions=3, max_length=4, nullable_fraction=0.2, unit_depth=2,
+                   window=4, terminals=('a', 'b'), seed=0):
+    """
+    Random grammar over N0 .. N{size-1} with start symbol N0.
+    Every non-terminal gets 'productions' random right-hand sides of 2..max_length symbols,
+    the first one naming the next non-terminal so the whole grammar is accessible, plus a
+    terminal production so it is productive. Right-hand sides only name the next 'window'
+    non-terminals, like the layers of a real grammar; with references across the whole
+    grammar ε-elimination creates unit productions between almost every pair of symbols
+    and the output grows quadratically. A 'nullable_fraction' of the non-terminals also
+    gets ε, and consecutive non-terminals are linked by unit productions into chains of
+    'unit_depth' steps (Ni → Ni+1).
+    """
+    rng = random.Random(seed)
+    names = [f"N{i}" for i in range(size)]
+    rules = {}
+    for i, nt in enumerate(names):
+        symbols = names[i + 1:i + 1 + window] + list(terminals)
+        prods = [(rng.choice(terminals),)]
+        for p in range(productions):
+            prod = [rng.choice(symbols) for _ in range(rng.randint(2, max(2, max_length)))]
+            if p == 0 and i + 1 < size:
+                prod[rng.randrange(len(prod))] = names[i + 1]
+            prods.append(tuple(prod))
+        if rng.random() < nullable_fraction:
+            prods.append(EPSILON)
+        if unit_depth and i % (unit_depth + 1) != unit_depth and i + 1 < size:
+            prods.append((names[i + 1],))
+        rules[nt] = prods
+    return Grammar(names, list(terminals), rules, start=names[0])
+
+
+def naive_nullable(grammar):
+    """The repeat-until-no-change loop the worklist replaced, kept as a baseline."""
+    nullable = set()
+    changed = True
+    while changed:
+        changed = False
+        for nt in grammar.rules:
+            if nt in nullable:
+                continue
+            for prod in grammar.rules[nt]:
+                if all(sym in nullable for sym in prod):
+                    nullable.add(nt)
+                    changed = True
+                    break
+    return nullable
+
+
+def measure(fn, repeat):
+    """
+    Runs fn() 'repeat' times and returns (best seconds, result of the last run).
+    """
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench_size(n, repeat, naive_limit):
+    grammar = chain_grammar(n)
+    results = {}
+    for name, fn in (("nullable", grammar.nullable_symbols),
+                     ("productive", grammar.productive_symbols),
+                     ("accessible", grammar.accessible_symbols)):
+        seconds, found = measure(fn, repeat)
+        if len(found) != n + 1:
+            raise AssertionError(f"{name} found {len(found)} of {n + 1} symbols")
+        results[name] = seconds
+    if n <= naive_limit:
+        seconds, found = measure(lambda: naive_nullable(grammar), repeat)
+        results["naive_nullable"] = seconds
+    return results
+
+
+def bench_length(k, repeat):
+    results = {}
+    for name, binarize_first in (("to_cnf", False), ("to_cnf_binarize_first", True)):
+        def convert():
+            grammar = long_production_grammar(k)
+            grammar.to_cnf(binarize_first=binarize_first)
+            return grammar
+        seconds, grammar = measure(convert, repeat)
+        productions = sum(len(prods) for prods in grammar.rules.values())
+        results[name] = {"seconds": seconds, "productions": productions}
+    return results
+
+
+def bench_random(sizes, repeat, options):
+    """
+    Converts random_grammar(n, **options) for every n with both step orders. Records time,
+    input and output size and the slowest step (from a separate profiled run).
+    """
+    results = {}
+    for n in sizes:
+        results[str(n)] = entry = {}
+        for name, binarize_first in (("to_cnf", False), ("to_cnf_binarize_first", True)):
+            def convert():
+                grammar = random_grammar(n, **options)
+                grammar.to_cnf(binarize_first=binarize_first)
+                return grammar
+            seconds, grammar = measure(convert, repeat)
+            profiled = random_grammar(n, **options)
+            profiled.start_profiling(memory=False)
+            profiled.to_cnf(binarize_first=binarize_first)
+            slowest = max(profiled.profile_report()["steps"], key=lambda step: step["seconds"])
+            entry[name] = {
+                "seconds": seconds,
+                "input": random_grammar(n, **options).size(),
+                "output": grammar.size(),
+                "slowest_step": slowest["step"],
+            }
+    return results
+
+
+def run(sizes, lengths, random_sizes, repeat, naive_limit, options, sections=SECTIONS):
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+    }
+    if "chains" in sections:
+        report["sizes"] = {str(n): bench_size(n, repeat, naive_limit) for n in sizes}
+    if "lengths" in sections:
+        report["lengths"] = {str(k): bench_length(k, repeat) for k in lengths}
+    if "random" in sections:
+        report["random_options"] = options
+        report["random"] = bench_random(random_sizes, repeat, options)
+    return report
+
+
+def print_report(report):
+    if "sizes" in report:
+        print(f"{'n':>8} {'analysis':<16} {'seconds':>12} {'µs per symbol':>14}")
+        for n, results in report["sizes"].items():
+            for name, seconds in results.items():
+                per_symbol = seconds / (int(n) + 1) * 1e6
+                print(f"{n:>8} {name:<16} {seconds:>12.6f} {per_symbol:>14.3f}")
+        print()
+    if "lengths" in report:
+        print(f"{'k':>8} {'conversion':<24} {'seconds':>12} {'productions':>12}")
+        for k, results in report["lengths"].items():
+            for name, r in results.items():
+                print(f"{k:>8} {name:<24} {r['seconds']:>12.6f} {r['productions']:>12}")
+        print()
+    if "random" in report:
+        print(f"{'n':>8} {'conversion':<24} {'seconds':>12} {'time x':>8} {'in prods':>10} "
+              f"{'out prods':>10} {'out x':>8}  slowest step")
+        previous = {}
+        for n, results in report["random"].items():
+            for name, r in results.items():
+                time_growth = size_growth = "-"
+                if name in previous:
+                    old = previous[name]
+                    if old["seconds"]:
+                        time_growth = f"{r['seconds'] / old['seconds']:.2f}"
+                    if old["output"]["productions"]:
+                        size_growth = f"{r['output']['productions'] / old['output']['productions']:.2f}"
+                previous[name] = r
+                print(f"{n:>8} {name:<24} {r['seconds']:>12.6f} {time_growth:>8} "
+                      f"{r['input']['productions']:>10} {r['output']['productions']:>10} {size_growth:>8}  "
+                      f"{r['slowest_step']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the CNF grammar analyses and conversion.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 200, 400, 800, 1600, 3200],
+                        help="chain lengths to benchmark")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[4, 8, 10, 12],
+                        help="long production lengths to convert to CNF")
+    parser.add_argument("--random-sizes", type=int, nargs="+", default=[100, 200, 400, 800, 1600],
+                        help="random grammar sizes (non-terminals) to convert to CNF")
+    parser.add_argument("--productions", type=int, default=3, help="random productions per non-terminal")
+    parser.add_argument("--max-length", type=int, default=4, help="longest random right-hand side")
+    parser.add_argument("--nullable", type=float, default=0.2, help="fraction of non-terminals with ε")
+    parser.add_argument("--unit-depth", type=int, default=2, help="length of the unit production chains")
+    parser.add_argument("--window", type=int, default=4, help="how many later non-terminals a rule may name")
+    parser.add_argument("--seed", type=int, default=0, help="random grammar seed")
+    parser.add_argument("--only", choices=SECTIONS, action="append", help="only run the named section(s)")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per benchmark (best is kept)")
+    parser.add_argument("--naive-limit", type=int, default=1600,
+                        help="largest chain the quadratic baseline is run on")
+    parser.add_argument("--json", help="write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    options = {
+        "productions": args.productions,
+        "max_length": args.max_length,
+        "nullable_fraction": args.nullable,
+        "unit_depth": args.unit_depth,
+        "window": args.window,
+        "seed": args.seed,
+    }
+    report = run(args.sizes, args.lengths, args.random_sizes, args.repeat, args.naive_limit, options,
+                 args.only or SECTIONS)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
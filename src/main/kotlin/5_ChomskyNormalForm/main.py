@@ -1,195 +1,588 @@
+import hashlib
+import heapq
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from collections import deque
+from functools import wraps
+from itertools import count, product
+from string import ascii_uppercase
+
 EPSILON = 'ε'
+# Version of the on-disk grammar format written by Grammar.save
+FORMAT_VERSION = 1
+
+
+def profiled(step):
+    """
+    Decorator for the Grammar conversion steps: when profiling is on (grammar.profile is a
+    list) it appends the step's wall time, peak memory and grammar sizes before and after.
+    """
+    @wraps(step)
+    def wrapper(self, *args, **kwargs):
+        if self.profile is None:
+            return step(self, *args, **kwargs)
+        before = self.size()
+        tracing = tracemalloc.is_tracing()
+        if self.profile_memory:
+            if tracing:
+                tracemalloc.reset_peak()
+            else:
+                tracemalloc.start()
+            base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            return step(self, *args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            peak = None
+            if self.profile_memory:
+                peak = tracemalloc.get_traced_memory()[1] - base
+                if not tracing:
+                    tracemalloc.stop()
+            self.profile.append({
+                "step": step.__name__,
+                "seconds": seconds,
+                "peak_bytes": peak,
+                "before": before,
+                "after": self.size(),
+            })
+    return wrapper
+
+
+def rewrites_rules(step):
+    """Decorator for steps that rewrite the rules in place: the add_rule / remove_rule tracking is dropped."""
+    @wraps(step)
+    def wrapper(self, *args, **kwargs):
+        self._tracking = None
+        return step(self, *args, **kwargs)
+    return wrapper
 
 
 class Grammar:
     def __init__(self, non_terminals, terminals, rules, start='S'):
-        self.non_terminals = non_terminals
-        self.terminals = terminals
-        self.rules = rules
-        self.start = start
+        # Symbol table: every symbol name is interned once as a small integer id and
+        # productions are stored as tuples of ids (ε is the empty tuple).
+        self.names = []
+        self.ids = {}
+        self.non_terminals = [self.intern(nt) for nt in non_terminals]
+        self.terminals = [self.intern(t) for t in terminals if t != EPSILON]
+        self.rules = {self.intern(nt): [self.to_production(prod) for prod in prods]
+                      for nt, prods in rules.items()}
+        self.start = self.intern(start)
+        # Candidate names for new non-terminals, consumed in order across calls
+        self._fresh_names = self._name_sequence()
+        # Step records collected by @profiled steps, None while profiling is off
+        self.profile = None
+        self.profile_memory = True
+        # Dependency information for add_rule / remove_rule, built on first use
+        self._tracking = None
+
+    def intern(self, name):
+        """Return the id of a symbol name, adding it to the symbol table if it is new."""
+        sym = self.ids.get(name)
+        if sym is None:
+            sym = len(self.names)
+            self.names.append(name)
+            self.ids[name] = sym
+        return sym
+
+    def to_production(self, prod):
+        """
+        Convert a production to a tuple of symbol ids. A string is read one character per
+        symbol (as in the lab grammars); any other sequence is read as a list of symbol names.
+        """
+        if prod == EPSILON:
+            return ()
+        return tuple(self.intern(sym) for sym in prod if sym != EPSILON)
+
+    def format_production(self, prod):
+        """Production as text; symbols are separated by spaces when any name is longer than one character."""
+        if not prod:
+            return EPSILON
+        names = [self.names[sym] for sym in prod]
+        separator = '' if all(len(name) == 1 for name in names) else ' '
+        return separator.join(names)
+
+    def named_rules(self):
+        """The rules with symbol names instead of ids: {non-terminal: [production text, ...]}."""
+        return {self.names[nt]: [self.format_production(prod) for prod in prods]
+                for nt, prods in self.rules.items()}
 
     def print_rules(self):
         """Print the grammar rules in a readable format."""
+        for nt, prods in self.named_rules().items():
+            print(f"{nt} → {' | '.join(prods)}")
+
+    def size(self):
+        """Number of non-terminals, productions and right-hand side symbols in total."""
+        productions = 0
+        symbols = 0
+        for prods in self.rules.values():
+            productions += len(prods)
+            symbols += sum(len(prod) for prod in prods)
+        return {"non_terminals": len(self.non_terminals), "productions": productions, "symbols": symbols}
+
+    def start_profiling(self, memory=True):
+        """
+        Record every conversion step from now on. Peak memory is measured with tracemalloc,
+        which slows the steps down; pass memory=False to get clean timings only.
+        """
+        self.profile = []
+        self.profile_memory = memory
+
+    def stop_profiling(self):
+        self.profile = None
+
+    def profile_report(self):
+        """The recorded steps plus their total time, as plain dicts and lists."""
+        steps = list(self.profile or ())
+        return {"steps": steps, "total_seconds": sum(step["seconds"] for step in steps)}
+
+    def profile_json(self, path=None):
+        """The profile report as JSON text, also written to 'path' when given."""
+        text = json.dumps(self.profile_report(), indent=2)
+        if path is not None:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text)
+        return text
+
+    def print_profile(self):
+        """Print the profile report as a table: time, peak memory and size changes per step."""
+        print(f"{'step':<34} {'seconds':>10} {'peak KiB':>10} {'non-terminals':>15} {'productions':>15} {'symbols':>15}")
+        for step in self.profile_report()["steps"]:
+            peak = f"{step['peak_bytes'] / 1024:.1f}" if step["peak_bytes"] is not None else "-"
+            sizes = [f"{step['before'][key]}→{step['after'][key]}"
+                     for key in ("non_terminals", "productions", "symbols")]
+            print(f"{step['step']:<34} {step['seconds']:>10.6f} {peak:>10} {sizes[0]:>15} {sizes[1]:>15} {sizes[2]:>15}")
+
+    def content_hash(self):
+        """
+        SHA-256 of the non-terminals, terminals, rules and start symbol by name, so equal
+        grammars hash equally whatever order their symbols were interned in.
+        """
+        names = self.names
+        data = [
+            [names[nt] for nt in self.non_terminals],
+            [names[t] for t in self.terminals],
+            [[names[nt], [[names[sym] for sym in prod] for prod in prods]] for nt, prods in self.rules.items()],
+            names[self.start],
+        ]
+        text = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def to_dict(self):
+        """Compact JSON-ready form: the symbol table plus every production as a list of ids."""
+        return {
+            "format": FORMAT_VERSION,
+            "names": self.names,
+            "non_terminals": self.non_terminals,
+            "terminals": self.terminals,
+            "start": self.start,
+            "rules": [[nt, [list(prod) for prod in prods]] for nt, prods in self.rules.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a grammar written by to_dict without re-interning any symbol."""
+        if not isinstance(data, dict):
+            raise ValueError("Not a grammar: expected a JSON object")
+        if data.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported grammar format: {data.get('format')!r}")
+        grammar = cls([], [], {})
+        grammar.names = list(data["names"])
+        grammar.ids = {name: sym for sym, name in enumerate(grammar.names)}
+        grammar.non_terminals = list(data["non_terminals"])
+        grammar.terminals = list(data["terminals"])
+        grammar.start = data["start"]
+        grammar.rules = {nt: [tuple(prod) for prod in prods] for nt, prods in data["rules"]}
+        return grammar
+
+    def save(self, path):
+        """Write the grammar to 'path' as compact JSON; the file is replaced atomically."""
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self.to_dict(), f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+    def _cnf_cache_path(self, cache_dir, binarize_first):
+        """
+        Cache file for the CNF of this grammar, keyed by its content hash, the options and the
+        file format, so entries written in an older format are simply never looked up.
+        """
+        mode = 'bin' if binarize_first else 'del'
+        return os.path.join(cache_dir, f"{self.content_hash()}-{mode}-v{FORMAT_VERSION}.json")
+
+    def _reverse_index(self, skip=()):
+        """
+        Map every symbol to the productions that mention it: {symbol: {(nt, prod): occurrences}}.
+        Symbols in 'skip' are left out. Also returns the per-production symbol counts used as
+        worklist counters.
+        """
+        index = {}
+        counters = {}
         for nt in self.rules:
-            print(f"{nt} → {' | '.join(self.rules[nt])}")
+            for prod in dict.fromkeys(self.rules[nt]):
+                self._index_production(index, counters, (nt, prod), skip)
+        return index, counters
+
+    @staticmethod
+    def _index_production(index, counters, key, skip, found=()):
+        """Add one production to a reverse index; its counter skips symbols already in 'found'."""
+        count = 0
+        for sym in key[1]:
+            if sym in skip:
+                continue
+            entries = index.setdefault(sym, {})
+            entries[key] = entries.get(key, 0) + 1
+            if sym not in found:
+                count += 1
+        counters[key] = count
+        return count
+
+    @staticmethod
+    def _propagate(index, counters, found, worklist=None, added=None):
+        """
+        Worklist fixpoint: every symbol in 'found' satisfies its occurrences in the productions
+        that mention it; a production with no unsatisfied symbols left adds its left-hand side
+        to 'found' (and to 'added', if given). Each occurrence is visited once, so this is linear.
+        """
+        worklist = list(found if worklist is None else worklist)
+        while worklist:
+            sym = worklist.pop()
+            for key, count in index.get(sym, {}).items():
+                counters[key] -= count
+                nt = key[0]
+                if counters[key] == 0 and nt not in found:
+                    found.add(nt)
+                    worklist.append(nt)
+                    if added is not None:
+                        added.append(nt)
+        return found
+
+    def nullable_symbols(self):
+        """Non-terminals that derive ε, found with a worklist over the reverse index."""
+        index, counters = self._reverse_index()
+        nullable = {nt for (nt, prod), count in counters.items() if count == 0}
+        return self._propagate(index, counters, nullable)
 
+    def productive_symbols(self):
+        """Non-terminals that derive a terminal string (terminals never need to be waited for)."""
+        index, counters = self._reverse_index(skip=set(self.terminals))
+        productive = {nt for (nt, prod), count in counters.items() if count == 0}
+        return self._propagate(index, counters, productive)
+
+    def accessible_symbols(self):
+        """Non-terminals reachable from the start symbol (breadth-first, each rule read once)."""
+        non_terminals = set(self.non_terminals)
+        accessible = {self.start}
+        worklist = [self.start]
+        while worklist:
+            nt = worklist.pop()
+            for prod in self.rules.get(nt, ()):
+                for sym in prod:
+                    if sym in non_terminals and sym not in accessible:
+                        accessible.add(sym)
+                        worklist.append(sym)
+        return accessible
+
+    @profiled
+    @rewrites_rules
     def eliminate_epsilon_productions(self):
         """Step 1: Eliminate ε-productions."""
-        # Find all nullable non-terminals
-        nullable = set()
-        for nt in self.non_terminals:
-            if EPSILON in self.rules[nt]:
-                nullable.add(nt)
-
-        # Find indirect nullable non-terminals
-        changed = True
-        while changed:
-            changed = False
-            for nt in self.non_terminals:
-                for prod in self.rules[nt]:
-                    if all(sym in nullable for sym in prod):
-                        if nt not in nullable:
-                            nullable.add(nt)
-                            changed = True
+        # Find all nullable non-terminals, directly or indirectly
+        nullable = self.nullable_symbols()
 
         # Generate new productions without ε
         new_rules = {}
         for nt in self.rules:
             new_prods = []
             for prod in self.rules[nt]:
-                if prod != EPSILON:
-                    # Generate all possible combinations without nullable symbols
-                    expansions = ['']
-                    for sym in prod:
-                        new_expansions = []
-                        for e in expansions:
-                            new_expansions.append(e + sym)
-                            if sym in nullable:
-                                new_expansions.append(e)
-                        expansions = new_expansions
-                    new_prods.extend([e for e in expansions if e])
-            new_rules[nt] = list(set(new_prods))  # Remove duplicates
+                new_prods.extend(self._expand(prod, nullable))
+            new_rules[nt] = list(dict.fromkeys(new_prods))  # Remove duplicates, keep order
 
         self.rules = new_rules
-        # Remove ε from terminals if present
-        if EPSILON in self.terminals:
-            self.terminals.remove(EPSILON)
 
+    @staticmethod
+    def _expand(prod, nullable):
+        """All non-empty versions of 'prod' with any subset of its nullable symbols left out."""
+        # Generate all possible combinations without nullable symbols
+        expansions = [()]
+        for sym in prod:
+            new_expansions = []
+            for e in expansions:
+                new_expansions.append(e + (sym,))
+                if sym in nullable:
+                    new_expansions.append(e)
+            expansions = new_expansions
+        return [e for e in expansions if e]
+
+    def _unit_components(self, units):
+        """
+        Strongly connected components of the unit graph (A → B edges), found with an
+        iterative Tarjan search. Components come out sinks first, so every component is
+        listed after all the components it has unit edges into.
+        """
+        index = {}
+        low = {}
+        stack = []
+        on_stack = set()
+        components = []
+        for root in units:
+            if root in index:
+                continue
+            index[root] = low[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            frames = [(root, iter(units[root]))]
+            while frames:
+                nt, successors = frames[-1]
+                for succ in successors:
+                    if succ not in index:
+                        index[succ] = low[succ] = len(index)
+                        stack.append(succ)
+                        on_stack.add(succ)
+                        frames.append((succ, iter(units.get(succ, ()))))
+                        break
+                    if succ in on_stack:
+                        low[nt] = min(low[nt], index[succ])
+                else:
+                    frames.pop()
+                    if frames:
+                        parent = frames[-1][0]
+                        low[parent] = min(low[parent], low[nt])
+                    if low[nt] == index[nt]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component.append(member)
+                            if member == nt:
+                                break
+                        components.append(component)
+        return components
+
+    @profiled
+    @rewrites_rules
     def eliminate_renaming(self):
-        """Step 2: Eliminate unit productions."""
-        changed = True
-        while changed:
-            changed = False
-            for nt in self.non_terminals:
-                # Find unit productions
-                unit_prods = [p for p in self.rules[nt]
-                              if len(p) == 1 and p in self.non_terminals]
-                for up in unit_prods:
-                    # Add productions of the unit non-terminal
-                    self.rules[nt].remove(up)
-                    for prod in self.rules[up]:
-                        if prod not in self.rules[nt]:
-                            self.rules[nt].append(prod)
-                            changed = True
+        """
+        Step 2: Eliminate unit productions.
+        Every non-terminal gets the non-unit productions of all non-terminals it reaches
+        through unit productions. Unit cycles collapse into one component that shares a
+        single closure, so each component's closure is built once from its successors'.
+        """
+        non_terminals = set(self.non_terminals)
+        units = {}
+        own = {}
+        for nt in self.rules:
+            units[nt] = []
+            own[nt] = {}  # Ordered set of non-unit productions
+            for prod in self.rules[nt]:
+                if len(prod) == 1 and prod[0] in non_terminals:
+                    if prod[0] != nt:
+                        units[nt].append(prod[0])
+                else:
+                    own[nt][prod] = None
+
+        closure = {}
+        for component in self._unit_components(units):
+            members = set(component)
+            prods = {}
+            for nt in component:
+                prods.update(own.get(nt, ()))
+            for nt in component:
+                for target in units.get(nt, ()):
+                    if target not in members:
+                        prods.update(closure[target])
+            for nt in component:
+                closure[nt] = prods
 
+        # A non-terminal lists its own productions first, then those reached through its units
+        for nt in self.rules:
+            prods = dict(own[nt])
+            for target in units[nt]:
+                prods.update(closure[target])
+            self.rules[nt] = list(prods)
+
+    @profiled
+    @rewrites_rules
     def eliminate_inaccessible_symbols(self):
         """Step 3: Eliminate inaccessible symbols."""
-        accessible = {self.start}
-        changed = True
-        while changed:
-            changed = False
-            for nt in list(accessible):
-                for prod in self.rules[nt]:
-                    for sym in prod:
-                        if sym in self.non_terminals and sym not in accessible:
-                            accessible.add(sym)
-                            changed = True
+        accessible = self.accessible_symbols()
 
         # Remove inaccessible symbols
         self.non_terminals = [nt for nt in self.non_terminals if nt in accessible]
         self.rules = {nt: self.rules[nt] for nt in self.non_terminals}
 
+    @profiled
+    @rewrites_rules
     def eliminate_non_productive_symbols(self):
         """Step 4: Eliminate non-productive symbols."""
-        productive = set()
         # Terminals are productive by definition
         # Find non-terminals that produce terminal strings
-        changed = True
-        while changed:
-            changed = False
-            for nt in self.non_terminals:
-                for prod in self.rules[nt]:
-                    if all(sym in productive or sym in self.terminals for sym in prod):
-                        if nt not in productive:
-                            productive.add(nt)
-                            changed = True
+        productive = self.productive_symbols()
 
         # Remove non-productive symbols
+        terminals = set(self.terminals)
         self.non_terminals = [nt for nt in self.non_terminals if nt in productive]
         self.rules = {nt: [prod for prod in self.rules[nt]
-                           if all(sym in productive or sym in self.terminals for sym in prod)]
+                           if all(sym in productive or sym in terminals for sym in prod)]
                       for nt in self.non_terminals}
 
+    @staticmethod
+    def _name_sequence():
+        """A, B, ..., Z, AA, AB, ..., ZZ, AAA, ... without end."""
+        for length in count(1):
+            for letters in product(ascii_uppercase, repeat=length):
+                yield ''.join(letters)
+
     def _create_new_non_terminal(self, existing):
-        """Helper to create new non-terminal symbols."""
-        for c in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ':
-            if c not in existing:
-                return c
-        # If all single letters are used, start combining
-        for c1 in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ':
-            for c2 in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ':
-                new_nt = c1 + c2
-                if new_nt not in existing:
-                    return new_nt
-        raise ValueError("Cannot create new non-terminal symbol")
-
-    def to_cnf(self):
-        """Convert grammar to Chomsky Normal Form."""
+        """
+        Helper to create new non-terminal symbols. 'existing' is the set of symbol ids in use
+        (the start symbol is always kept); the name sequence resumes where the previous call
+        stopped, so names are never rescanned. Returns the id of the new symbol.
+        """
+        for name in self._fresh_names:
+            sym = self.ids.get(name)
+            if sym is None or (sym not in existing and sym != self.start):
+                return self.intern(name)
+
+    @profiled
+    @rewrites_rules
+    def binarize(self):
+        """
+        Split every production longer than two symbols into a right-nested chain of new
+        non-terminals: A → X1 X2 ... Xn becomes A → X1 N1, N1 → X2 N2, ..., Nn-2 → Xn-1 Xn.
+        Productions with the same tail share its chain.
+        """
+        tails = {}
+        taken = set(self.non_terminals)
+        taken.update(self.terminals)
+        new_rules = {}
+        for nt in self.rules:
+            new_prods = []
+            for prod in self.rules[nt]:
+                if len(prod) > 2:
+                    prod = (prod[0], self._binarize_tail(prod[1:], tails, new_rules, taken))
+                new_prods.append(prod)
+            self.rules[nt] = new_prods
+        self.rules.update(new_rules)
+
+    def _binarize_tail(self, tail, tails, new_rules, taken):
+        """Return the non-terminal standing for 'tail', creating the chain for it if needed."""
+        # Walk from the right so every shorter tail exists before the one that needs it
+        head = None
+        for start in range(len(tail) - 2, -1, -1):
+            key = tail[start:]
+            sym = tails.get(key)
+            if sym is None:
+                sym = self._create_new_non_terminal(taken)
+                taken.add(sym)
+                self.non_terminals.append(sym)
+                new_rules[sym] = [tail[start:start + 2] if head is None else (tail[start], head)]
+                tails[key] = sym
+            head = sym
+        return head
+
+    def to_cnf(self, binarize_first=False, cache_dir=None):
+        """
+        Convert grammar to Chomsky Normal Form.
+        With binarize_first=True long productions are split before ε-productions are removed,
+        so a production with k nullable symbols adds O(k) productions instead of 2^k.
+        With a cache_dir the result is looked up there by the grammar's content hash first,
+        and saved there after a conversion. An unreadable or corrupt entry counts as a miss
+        and is overwritten.
+        """
+        cache_path = None
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            cache_path = self._cnf_cache_path(cache_dir, binarize_first)
+            try:
+                cached = Grammar.load(cache_path)
+            except (OSError, ValueError, KeyError, TypeError):
+                cached = None  # Missing, truncated or not a grammar: convert and overwrite it
+            if cached is not None:
+                self.names, self.ids = cached.names, cached.ids
+                self.non_terminals, self.terminals = cached.non_terminals, cached.terminals
+                self.rules, self.start = cached.rules, cached.start
+                self._tracking = None
+                return
+
+        if binarize_first:
+            self.binarize()
         # Step 1-4 already implemented
         self.eliminate_epsilon_productions()
         self.eliminate_renaming()
         self.eliminate_inaccessible_symbols()
         self.eliminate_non_productive_symbols()
-
         # Step 5: Convert remaining productions to CNF
+        self.split_productions()
+
+        if cache_path is not None:
+            self.save(cache_path)
+
+    @profiled
+    @rewrites_rules
+    def split_productions(self):
+        """Step 5: Convert remaining productions to CNF."""
         new_rules = {}
         terminal_productions = {}
+        pairs = {}  # Two-symbol right-hand side -> the new non-terminal deriving it
+        terminals = set(self.terminals)
+        taken = set(self.non_terminals)
+        taken.update(terminals)
 
         # Create new productions for terminals
         for t in self.terminals:
-            new_nt = self._create_new_non_terminal(self.non_terminals)
+            new_nt = self._create_new_non_terminal(taken)
+            taken.add(new_nt)
             terminal_productions[t] = new_nt
             self.non_terminals.append(new_nt)
-            new_rules[new_nt] = [t]
+            new_rules[new_nt] = [(t,)]
 
         # Process all rules
         for nt in list(self.rules):
             new_prods = []
             for prod in self.rules[nt]:
                 # Case 1: Production is single terminal
-                if len(prod) == 1 and prod in self.terminals:
+                if len(prod) == 1 and prod[0] in terminals:
                     new_prods.append(prod)
                 # Case 2: Production is two symbols (terminal or non-terminal)
                 elif len(prod) == 2:
                     # Replace terminals with their new non-terminals
-                    new_prod = []
-                    for sym in prod:
-                        if sym in self.terminals:
-                            new_prod.append(terminal_productions[sym])
-                        else:
-                            new_prod.append(sym)
-                    new_prods.append(''.join(new_prod))
+                    new_prods.append(tuple(terminal_productions.get(sym, sym) for sym in prod))
                 # Case 3: Production length > 2 - break it down
                 elif len(prod) > 2:
-                    current = prod
                     # Replace terminals first
-                    temp = []
-                    for sym in current:
-                        if sym in self.terminals:
-                            temp.append(terminal_productions[sym])
-                        else:
-                            temp.append(sym)
-                    current = ''.join(temp)
+                    current = tuple(terminal_productions.get(sym, sym) for sym in prod)
 
                     # Break down long productions
                     while len(current) > 2:
                         first_two = current[:2]
                         remaining = current[2:]
 
-                        # Check if we already have a rule for these two symbols
-                        found = False
-                        for existing_nt in new_rules:
-                            if first_two in new_rules[existing_nt]:
-                                new_nt = existing_nt
-                                found = True
-                                break
-
-                        if not found:
-                            new_nt = self._create_new_non_terminal(self.non_terminals)
+                        # Reuse the rule for these two symbols if we already made one
+                        new_nt = pairs.get(first_two)
+                        if new_nt is None:
+                            new_nt = self._create_new_non_terminal(taken)
+                            taken.add(new_nt)
                             self.non_terminals.append(new_nt)
                             new_rules[new_nt] = [first_two]
+                            pairs[first_two] = new_nt
 
-                        current = new_nt + remaining
+                        current = (new_nt,) + remaining
                     new_prods.append(current)
             self.rules[nt] = new_prods
 
@@ -198,19 +591,541 @@ class Grammar:
 
     def is_cnf(self):
         """Check if grammar is in CNF."""
+        terminals = set(self.terminals)
         for nt in self.rules:
             for prod in self.rules[nt]:
                 # Valid CNF productions are:
                 # 1. Single terminal
                 # 2. Two non-terminals
-                if len(prod) == 1 and prod not in self.terminals:
+                if len(prod) == 1 and prod[0] not in terminals:
                     return False
-                if len(prod) == 2 and any(sym in self.terminals for sym in prod):
+                if len(prod) == 2 and any(sym in terminals for sym in prod):
                     return False
-                if len(prod) > 2:
+                if len(prod) > 2 or not prod:
                     return False
         return True
 
+    # --- Incremental editing --- #
+
+    def _track(self):
+        """Build the dependency information kept up to date by add_rule / remove_rule."""
+        if self._tracking is None:
+            self._tracking = _Tracking(self)
+        return self._tracking
+
+    def _declare(self, name, state):
+        """Intern a symbol name; a symbol that is neither terminal nor known becomes a non-terminal."""
+        sym = self.intern(name)
+        if sym not in state.terminals and sym not in state.non_terminals:
+            self.non_terminals.append(sym)
+            state.non_terminals.add(sym)
+        return sym
+
+    def add_rule(self, nt, prod):
+        """
+        Add the production nt → prod (written like the constructor's productions) and update
+        the nullable, productive and accessible sets and the cached CNF of the symbols it affects.
+        """
+        state = self._track()
+        nt = self._declare(nt, state)
+        prod = self.to_production(prod)
+        for sym in prod:
+            self._declare(sym, state)
+        prods = self.rules.setdefault(nt, [])
+        if prod in prods:
+            return
+        prods.append(prod)
+        key = (nt, prod)
+
+        changed = []  # Symbols whose nullable or productive status changed
+        for fixpoint in state.analyses():
+            if self._index_production(fixpoint.index, fixpoint.counters, key, fixpoint.skip, fixpoint.found) == 0:
+                height = self._height(fixpoint, key)
+                if nt not in fixpoint.found:
+                    self._settle(fixpoint, [(height, nt)], changed)
+                elif height <= fixpoint.height[nt]:
+                    fixpoint.support[nt] += 1
+
+        if nt in state.accessible:
+            self._reach(state, nt, prod)
+        self._invalidate(state, nt, changed)
+
+    def remove_rule(self, nt, prod):
+        """Remove the production nt → prod, updating the same information as add_rule."""
+        state = self._track()
+        nt_name = nt
+        nt = self.ids.get(nt)
+        prod = self.to_production(prod)
+        if nt not in self.rules or prod not in self.rules[nt]:
+            raise ValueError(f"No production {nt_name} → {self.format_production(prod)}")
+        self.rules[nt] = [p for p in self.rules[nt] if p != prod]
+        key = (nt, prod)
+
+        changed = []
+        for fixpoint in state.analyses():
+            changed.extend(self._retract(fixpoint, key))
+
+        self._retract_accessible(state, nt, prod)
+        self._invalidate(state, nt, changed)
+
+    @staticmethod
+    def _height(fixpoint, key):
+        """Height a satisfied production gives its head: one more than its highest counted symbol."""
+        return 1 + max((fixpoint.height[sym] for sym in key[1] if sym not in fixpoint.skip), default=0)
+
+    def _settle(self, fixpoint, heap, added=None):
+        """
+        Knuth's generalization of Dijkstra's algorithm over a heap of (height, non-terminal)
+        candidates: the lowest one is added to 'found' (and to 'added', if given), and every
+        production it completes makes its head a candidate. A found symbol's support counts its
+        satisfied productions no higher than its own height; those only name lower symbols,
+        so supports never form a cycle and a symbol with support left is still derivable.
+        """
+        index, counters, found = fixpoint.index, fixpoint.counters, fixpoint.found
+        height, support = fixpoint.height, fixpoint.support
+        heapq.heapify(heap)
+        while heap:
+            level, nt = heapq.heappop(heap)
+            if nt in found:
+                continue
+            found.add(nt)
+            height[nt] = level
+            if added is not None:
+                added.append(nt)
+            support[nt] = sum(1 for prod in dict.fromkeys(self.rules.get(nt, ()))
+                              if counters[(nt, prod)] == 0 and self._height(fixpoint, (nt, prod)) <= level)
+            for key, count in index.get(nt, {}).items():
+                counters[key] -= count
+                if counters[key] == 0:
+                    head = key[0]
+                    if head not in found:
+                        heapq.heappush(heap, (self._height(fixpoint, key), head))
+                    elif self._height(fixpoint, key) <= height[head]:
+                        support[head] += 1
+
+    def _retract(self, fixpoint, key):
+        """
+        Remove a production from one fixpoint. Only symbols whose support drops to zero lose
+        their height, and they are derived again (if they can be) from the symbols that kept
+        theirs, so the work is bounded by the symbols the edit affects.
+        Returns the symbols that left 'found'.
+        """
+        index, counters, found = fixpoint.index, fixpoint.counters, fixpoint.found
+        height, support = fixpoint.height, fixpoint.support
+        nt = key[0]
+        supporting = counters[key] == 0 and nt in found and self._height(fixpoint, key) <= height[nt]
+        for sym in set(key[1]):
+            index.get(sym, {}).pop(key, None)
+        del counters[key]
+        if not supporting:
+            return []
+        support[nt] -= 1
+        if support[nt]:
+            return []
+        lost = [nt]
+        for sym in lost:  # 'lost' grows while we iterate over it.
+            for other, count in index.get(sym, {}).items():
+                head = other[0]
+                if counters[other] == 0 and head in found and self._height(fixpoint, other) <= height[head]:
+                    support[head] -= 1
+                    if support[head] == 0:
+                        lost.append(head)
+                counters[other] += count
+        for sym in lost:
+            found.discard(sym)
+            del height[sym]
+            del support[sym]
+        heap = [(self._height(fixpoint, (sym, prod)), sym)
+                for sym in lost for prod in dict.fromkeys(self.rules.get(sym, ()))
+                if counters[(sym, prod)] == 0]
+        restored = []
+        self._settle(fixpoint, heap, restored)
+        return list(set(lost).difference(restored))
+
+    def _accessible_depths(self):
+        """Breadth-first depth of every accessible non-terminal: the fewest rules from the start symbol."""
+        non_terminals = set(self.non_terminals)
+        depth = {self.start: 0}
+        queue = deque([self.start])
+        while queue:
+            nt = queue.popleft()
+            for prod in self.rules.get(nt, ()):
+                for sym in prod:
+                    if sym in non_terminals and sym not in depth:
+                        depth[sym] = depth[nt] + 1
+                        queue.append(sym)
+        return depth
+
+    @staticmethod
+    def _support(state, sym):
+        """Occurrences of sym in productions of non-terminals one level closer to the start."""
+        parent = state.depth[sym] - 1
+        return sum(count for (head, prod), count in state.null_index.get(sym, {}).items()
+                   if state.depth.get(head) == parent)
+
+    def _reach(self, state, nt, prod):
+        """
+        Update the accessible depths after nt → prod was added with nt accessible: breadth-first
+        from nt, only through the symbols the new production brings closer to the start.
+        """
+        depth, support = state.depth, state.support
+        lowered = {}
+        queue = deque()
+
+        def visit(head, prod):
+            for sym in prod:
+                if sym not in state.non_terminals:
+                    continue
+                if sym not in depth or depth[sym] > depth[head] + 1:
+                    depth[sym] = depth[head] + 1
+                    lowered[sym] = None
+                    queue.append(sym)
+                elif depth[sym] == depth[head] + 1 and sym not in lowered:
+                    support[sym] += 1
+
+        visit(nt, prod)
+        while queue:
+            head = queue.popleft()
+            for prod in dict.fromkeys(self.rules.get(head, ())):
+                visit(head, prod)
+        state.accessible.update(lowered)
+        for sym in lowered:
+            support[sym] = self._support(state, sym)
+
+    def _retract_accessible(self, state, nt, prod):
+        """
+        Update the accessible depths after nt → prod was removed. Every accessible symbol counts
+        the occurrences that support its depth (see _support); those edges always go one level
+        down, so they form no cycles and a symbol only loses its depth when its count drops to
+        zero. The symbols that lost it get new depths from their remaining accessible parents.
+        """
+        depth, support = state.depth, state.support
+        if nt not in depth:
+            return
+        lost = []
+        for sym in prod:
+            if depth.get(sym) == depth[nt] + 1:
+                support[sym] -= 1
+                if support[sym] == 0:
+                    lost.append(sym)
+        for sym in lost:  # 'lost' grows while we iterate over it.
+            for child_prod in dict.fromkeys(self.rules.get(sym, ())):
+                for child in child_prod:
+                    if depth.get(child) == depth[sym] + 1:
+                        support[child] -= 1
+                        if support[child] == 0:
+                            lost.append(child)
+        if not lost:
+            return
+        lost = set(lost)
+        for sym in lost:
+            del depth[sym]
+            del support[sym]
+        # Re-derive the lost depths, closest first, from parents that kept theirs
+        heap = []
+        for sym in lost:
+            parents = [depth[head] for head, _ in state.null_index.get(sym, {}) if head in depth]
+            if parents:
+                heapq.heappush(heap, (min(parents) + 1, sym))
+        regained = []
+        while heap:
+            level, sym = heapq.heappop(heap)
+            if sym in depth:
+                continue
+            depth[sym] = level
+            regained.append(sym)
+            for child_prod in self.rules.get(sym, ()):
+                for child in child_prod:
+                    if child in lost and child not in depth:
+                        heapq.heappush(heap, (level + 1, child))
+        state.accessible.difference_update(lost.difference(regained))
+        for sym in regained:
+            support[sym] = self._support(state, sym)
+            for child_prod in dict.fromkeys(self.rules.get(sym, ())):
+                for child in child_prod:
+                    if child not in lost and depth.get(child) == depth[sym] + 1:
+                        support[child] += 1
+
+    def _invalidate(self, state, nt, changed):
+        """
+        Drop the cached ε-free expansions of nt and of every rule naming a symbol whose status
+        changed, then the cached CNF of those non-terminals and of all non-terminals that reach
+        them through (possibly ε-derived) unit productions.
+        """
+        direct = {nt}
+        for sym in changed:
+            direct.update(head for head, prod in state.null_index.get(sym, {}))
+        for sym in direct:
+            state.expansions.pop(sym, None)
+        stack = list(direct)
+        while stack:
+            sym = stack.pop()
+            for head, prod in state.null_index.get(sym, {}):
+                if head not in direct and all(s == sym or s in state.nullable for s in prod):
+                    direct.add(head)
+                    stack.append(head)
+        for sym in direct:
+            state.cnf.pop(sym, None)
+
+    def _expansions_of(self, state, nt):
+        """Cached ε-free productions of nt (step 1 for one non-terminal)."""
+        prods = state.expansions.get(nt)
+        if prods is None:
+            prods = []
+            for prod in self.rules.get(nt, ()):
+                prods.extend(self._expand(prod, state.nullable))
+            prods = state.expansions[nt] = list(dict.fromkeys(prods))
+        return prods
+
+    def _cnf_of(self, state, nt):
+        """
+        Cached CNF productions of one non-terminal as (productions by name, non-terminal ids
+        they mention, helper rules): steps 1, 2 and 4 restricted to nt, then step 5 with helper
+        non-terminals named after what they derive.
+        """
+        entry = state.cnf.get(nt)
+        if entry is not None:
+            return entry
+        reached = {nt}
+        stack = [nt]
+        kept = {}
+        while stack:
+            for prod in self._expansions_of(state, stack.pop()):
+                if len(prod) == 1 and prod[0] in state.non_terminals:
+                    if prod[0] not in reached:
+                        reached.add(prod[0])
+                        stack.append(prod[0])
+                elif all(sym in state.productive or sym in state.terminals for sym in prod):
+                    kept[prod] = None
+        helpers = {}
+        prods = [self._cnf_production(prod, state.terminals, helpers) for prod in kept]
+        mentioned = {sym for prod in kept for sym in prod if sym in state.non_terminals}
+        entry = state.cnf[nt] = (prods, mentioned, helpers)
+        return entry
+
+    def _cnf_production(self, prod, terminals, helpers):
+        """One ε-free, non-unit production in CNF by name; <a> → a and <X Y Z> → X <Y Z> go to 'helpers'."""
+        names = self.names
+
+        def wrap(sym):
+            if sym not in terminals:
+                return names[sym]
+            name = f"<{names[sym]}>"
+            helpers[name] = [(names[sym],)]
+            return name
+
+        if len(prod) == 1:
+            return (names[prod[0]],)
+        # Build the right-nested helpers for the tail, shortest first
+        tail = wrap(prod[-1])
+        for start in range(len(prod) - 2, 0, -1):
+            name = "<" + " ".join(names[sym] for sym in prod[start:]) + ">"
+            if name not in helpers:
+                helpers[name] = [(wrap(prod[start]), tail)]
+            tail = name
+        return (wrap(prod[0]), tail)
+
+    def cnf_rules(self):
+        """
+        CNF of the current grammar as {non-terminal: [production as a tuple of names]}, without
+        changing the grammar. Each non-terminal's part is cached and recomputed only after an
+        add_rule / remove_rule that affects it; this call just collects the parts reachable
+        from the start symbol.
+        """
+        state = self._track()
+        rules = {}
+        if self.start not in state.productive:
+            return rules
+        seen = {self.start}
+        stack = [self.start]
+        while stack:
+            nt = stack.pop()
+            prods, mentioned, helpers = self._cnf_of(state, nt)
+            rules[self.names[nt]] = prods
+            rules.update(helpers)
+            for sym in mentioned:
+                if sym not in seen:
+                    seen.add(sym)
+                    stack.append(sym)
+        return rules
+
+    def cnf_grammar(self):
+        """The result of cnf_rules() as a new Grammar (usable with CYKParser)."""
+        rules = self.cnf_rules()
+        return Grammar(list(rules), [self.names[t] for t in self.terminals], rules,
+                       start=self.names[self.start])
+
+
+class _Tracking:
+    """
+    What add_rule / remove_rule keep up to date: the reverse indexes and counters of the
+    nullable and productive fixpoints, the three symbol sets, the accessible depths with their
+    support counts and the per-non-terminal caches.
+    """
+
+    def __init__(self, grammar):
+        self.terminals = set(grammar.terminals)
+        self.non_terminals = set(grammar.non_terminals)
+        self.nullable_fixpoint = _Fixpoint(grammar)
+        self.productive_fixpoint = _Fixpoint(grammar, self.terminals)
+        self.null_index = self.nullable_fixpoint.index
+        self.nullable = self.nullable_fixpoint.found
+        self.productive = self.productive_fixpoint.found
+        self.depth = grammar._accessible_depths()  # accessible nt -> breadth-first depth
+        self.accessible = set(self.depth)
+        self.support = {sym: grammar._support(self, sym) for sym in self.depth}
+        self.expansions = {}  # nt -> ε-free productions
+        self.cnf = {}  # nt -> (CNF productions, mentioned non-terminals, helper rules)
+
+    def analyses(self):
+        """The nullable and productive fixpoints."""
+        return self.nullable_fixpoint, self.productive_fixpoint
+
+
+class _Fixpoint:
+    """
+    One fixpoint kept up to date by add_rule / remove_rule: its reverse index and counters,
+    the symbols found so far, the height each one was derived at and its support (see
+    Grammar._settle). Symbols in 'skip' never need to be waited for.
+    """
+
+    def __init__(self, grammar, skip=()):
+        self.skip = skip
+        self.index, self.counters = grammar._reverse_index(skip)
+        self.found = set()
+        self.height = {}
+        self.support = {}
+        grammar._settle(self, [(1, nt) for (nt, prod), count in self.counters.items() if count == 0])
+
+
+class CYKParser:
+    """
+    CYK recognizer and parser for a grammar in CNF.
+    Every table cell is a bitset (a Python int) of the non-terminals deriving that substring,
+    and the binary rules are precomputed as tables from a left non-terminal's bit to
+    (right bit, heads bitset) pairs, so filling a cell is a few AND / OR operations per split.
+    """
+
+    def __init__(self, grammar):
+        if not grammar.is_cnf():
+            raise ValueError("CYK needs a grammar in Chomsky Normal Form")
+        self.grammar = grammar
+        self.bits = {nt: 1 << i for i, nt in enumerate(grammar.rules)}
+        self.terminal_heads = {}  # terminal name -> bitset of A with A → terminal
+        pair_heads = {}  # (left bit, right bit) -> bitset of A with A → left right
+        for nt, prods in grammar.rules.items():
+            for prod in prods:
+                if len(prod) == 1:
+                    name = grammar.names[prod[0]]
+                    self.terminal_heads[name] = self.terminal_heads.get(name, 0) | self.bits[nt]
+                elif prod[0] in self.bits and prod[1] in self.bits:
+                    key = (self.bits[prod[0]], self.bits[prod[1]])
+                    pair_heads[key] = pair_heads.get(key, 0) | self.bits[nt]
+        self.by_left = {}  # left bit -> [(right bit, heads bitset), ...]
+        for (left, right), heads in pair_heads.items():
+            self.by_left.setdefault(left, []).append((right, heads))
+        self.start_bit = self.bits.get(grammar.start, 0)
+
+    def table(self, word):
+        """
+        Fill the CYK table for 'word' (a string, one character per terminal, or a sequence of
+        terminal names). cells[length][i] is the bitset of non-terminals deriving word[i:i + length].
+        """
+        n = len(word)
+        cells = [None, [self.terminal_heads.get(sym, 0) for sym in word]]
+        by_left = self.by_left
+        for length in range(2, n + 1):
+            row = []
+            for i in range(n - length + 1):
+                heads = 0
+                for k in range(1, length):
+                    left = cells[k][i]
+                    right = cells[length - k][i + k]
+                    if not left or not right:
+                        continue
+                    while left:
+                        low = left & -left
+                        left ^= low
+                        for right_bit, pair in by_left.get(low, ()):
+                            if right & right_bit:
+                                heads |= pair
+                row.append(heads)
+            cells.append(row)
+        return cells
+
+    def recognize(self, word):
+        """True if the start symbol derives 'word'. The empty word is never in a CNF language."""
+        if not word:
+            return False
+        return bool(self.table(word)[len(word)][0] & self.start_bit)
+
+    def recognize_many(self, words):
+        """Recognize a batch of words with the same precomputed tables."""
+        return [self.recognize(word) for word in words]
+
+    def parse(self, word, forest=False):
+        """
+        Return one parse tree for 'word' as nested tuples (non-terminal, children...), with
+        terminals as plain names, or None if the word is not in the language.
+        With forest=True return the whole shared parse forest instead: a dict from
+        (non-terminal, start, length) to the list of its alternatives, each either a terminal
+        name or a pair of child keys.
+        """
+        if not word:
+            return None
+        cells = self.table(word)
+        n = len(word)
+        if not cells[n][0] & self.start_bit:
+            return None
+        names = self.grammar.names
+        root = (names[self.grammar.start], 0, n)
+        packed = {}
+        stack = [(self.grammar.start, 0, n)]
+        while stack:
+            nt, i, length = stack.pop()
+            named = (names[nt], i, length)
+            if named in packed:
+                continue
+            packed[named] = alternatives = []
+            for prod in self.grammar.rules[nt]:
+                if len(prod) == 1:
+                    if length == 1 and names[prod[0]] == word[i]:
+                        alternatives.append(word[i])
+                    continue
+                left, right = prod
+                for k in range(1, length):
+                    if cells[k][i] & self.bits[left] and cells[length - k][i + k] & self.bits[right]:
+                        alternatives.append(((names[left], i, k), (names[right], i + k, length - k)))
+                        stack.append((left, i, k))
+                        stack.append((right, i + k, length - k))
+                        if not forest:
+                            break
+                if alternatives and not forest:
+                    break
+        if forest:
+            return packed
+        return self._build_tree(packed, root)
+
+    @staticmethod
+    def _build_tree(packed, root):
+        """Turn the first alternative of every forest node into a nested tuple tree."""
+        built = {}
+        stack = [root]
+        while stack:
+            key = stack[-1]
+            alternative = packed[key][0]
+            if isinstance(alternative, str):
+                built[key] = (key[0], alternative)
+                stack.pop()
+                continue
+            missing = [child for child in alternative if child not in built]
+            if missing:
+                stack.extend(missing)
+                continue
+            built[key] = (key[0],) + tuple(built[child] for child in alternative)
+            stack.pop()
+        return built[root]
+
 
 def main():
     # Variant 4 grammar
@@ -251,6 +1166,19 @@ def main():
 
     print("\nGrammar is now in CNF:", grammar.is_cnf())
 
+    print("\nStep 6: CYK membership")
+    parser = CYKParser(grammar)
+    words = ['a', 'ab', 'ba', 'bab', 'abab', 'abc']
+    for word, accepted in zip(words, parser.recognize_many(words)):
+        print(f"{word}: {accepted}")
+    print("Parse tree for 'bab':", parser.parse('bab'))
+
+    print("\nStep profile of a fresh conversion")
+    profiled_grammar = Grammar(Vn, Vt, P)
+    profiled_grammar.start_profiling()
+    profiled_grammar.to_cnf()
+    profiled_grammar.print_profile()
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,6 +1,9 @@
+import operator
 import re
+from array import array
+from bisect import bisect_right
 from enum import Enum, auto
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
 from typing import List, Optional, Union
 
 
@@ -65,6 +68,7 @@ class ASTNodeType(Enum):
     VARIABLE_DECLARATION = auto()
     ASSIGNMENT = auto()
     BINARY_OPERATION = auto()
+    UNARY_OPERATION = auto()
     LITERAL = auto()
     IDENTIFIER = auto()
     IF_STATEMENT = auto()
@@ -89,7 +93,7 @@ class ProgramNode(ASTNode):
 @dataclass
 class VariableDeclarationNode(ASTNode):
     identifier: str
-    value: ASTNode
+    value: Optional[ASTNode]  # None only declares the variable (see Optimizer)
 
 
 @dataclass
@@ -105,6 +109,12 @@ class BinaryOperationNode(ASTNode):
     right: ASTNode
 
 
+@dataclass
+class UnaryOperationNode(ASTNode):
+    operator: TokenType
+    operand: ASTNode
+
+
 @dataclass
 class LiteralNode(ASTNode):
     value: Union[int, float, str, bool]
@@ -157,112 +167,177 @@ class BlockNode(ASTNode):
 
 
 # Lexer
+# One pattern per token kind, named after its TokenType. Alternatives are tried in order, so
+# longer tokens come first (FLOAT before INT, '==' before '='); keywords and booleans are
+# matched as IDENTIFIER and looked up in KEYWORDS, so 'iffy' stays one identifier.
+TOKEN_PATTERNS = [
+    ('WHITESPACE', r'\s+'),
+    ('COMMENT', r'#[^\n]*'),
+    ('FLOAT', r'\d+\.\d+'),
+    ('INT', r'\d+'),
+    ('STRING', r'"[^"]*"'),
+    ('IDENTIFIER', r'[a-zA-Z_][a-zA-Z0-9_]*'),
+    ('EQEQ', r'=='),
+    ('NEQ', r'!='),
+    ('LTE', r'<='),
+    ('GTE', r'>='),
+    ('PLUS', r'\+'),
+    ('MINUS', r'-'),
+    ('MULTIPLY', r'\*'),
+    ('DIVIDE', r'/'),
+    ('EQUALS', r'='),
+    ('LT', r'<'),
+    ('GT', r'>'),
+    ('LPAREN', r'\('),
+    ('RPAREN', r'\)'),
+    ('LBRACE', r'\{'),
+    ('RBRACE', r'\}'),
+    ('COMMA', r','),
+    ('SEMICOLON', r';'),
+]
+MASTER_PATTERN = re.compile('|'.join(f'(?P<{name}>{pattern})' for name, pattern in TOKEN_PATTERNS))
+SKIPPED = {'WHITESPACE', 'COMMENT'}
+KINDS = {name: TokenType[name] for name, _ in TOKEN_PATTERNS if name not in SKIPPED}
+
+KEYWORDS = {
+    'if': TokenType.IF,
+    'else': TokenType.ELSE,
+    'while': TokenType.WHILE,
+    'for': TokenType.FOR,
+    'function': TokenType.FUNCTION,
+    'return': TokenType.RETURN,
+    'var': TokenType.VAR,
+    'print': TokenType.PRINT,
+    'true': TokenType.BOOL,
+    'false': TokenType.BOOL,
+}
+
+
 class Lexer:
     def __init__(self, text):
         self.text = text
         self.pos = 0
-        self.line = 1
-        self.column = 1
-        self.current_char = self.text[self.pos] if self.pos < len(self.text) else None
-
-    def advance(self):
-        if self.current_char == '\n':
-            self.line += 1
-            self.column = 1
-        else:
-            self.column += 1
+        # Offset where every line starts, for turning positions into line/column
+        self.line_starts = [0] + [m.end() for m in re.finditer('\n', text)]
 
-        self.pos += 1
-        if self.pos < len(self.text):
-            self.current_char = self.text[self.pos]
-        else:
-            self.current_char = None
-
-    def skip_whitespace(self):
-        while self.current_char is not None and self.current_char.isspace():
-            self.advance()
-
-    def skip_comment(self):
-        while self.current_char != '\n' and self.current_char is not None:
-            self.advance()
-        self.advance()
+    def position(self, pos):
+        """Line and column (both from 1) of an offset in the text."""
+        line = bisect_right(self.line_starts, pos)
+        return line, pos - self.line_starts[line - 1] + 1
 
     def get_next_token(self):
-        while self.current_char is not None:
-            if self.current_char.isspace():
-                self.skip_whitespace()
+        text = self.text
+        while self.pos < len(text):
+            match = MASTER_PATTERN.match(text, self.pos)
+            if match is None:
+                line, column = self.position(self.pos)
+                raise Exception(f"Unexpected character '{text[self.pos]}' at line {line}, column {column}")
+
+            start = self.pos
+            self.pos = match.end()
+            kind = match.lastgroup
+            if kind in SKIPPED:
                 continue
 
-            if self.current_char == '#':
-                self.skip_comment()
-                continue
+            value = match.group()
+            if kind == 'IDENTIFIER':
+                token_type = KEYWORDS.get(value, TokenType.IDENTIFIER)
+            else:
+                token_type = KINDS[kind]
+            line, column = self.position(start)
+            return Token(token_type, value, line, column)
+
+        line, column = self.position(self.pos)
+        return Token(TokenType.EOF, '', line, column)
+
+    def tokens(self):
+        """Generate the tokens one by one, ending with the EOF token."""
+        while True:
+            token = self.get_next_token()
+            yield token
+            if token.type == TokenType.EOF:
+                return
+
+
+# Token stream
+class TokenStream:
+    """
+    Buffered lookahead over a token generator. Tokens are pulled on demand into a ring
+    buffer (a list used circularly, doubled when full), so peek(k) is an index computation
+    and nothing is ever lexed twice. Past the end every call returns the EOF token.
+    """
 
-            # Try to match token patterns
-            token = self.try_match_token()
-            if token:
-                return token
-
-            raise Exception(f"Unexpected character '{self.current_char}' at line {self.line}, column {self.column}")
-
-        return Token(TokenType.EOF, '', self.line, self.column)
-
-    def try_match_token(self):
-        # Match patterns for each token type
-        patterns = [
-            (TokenType.INT, r'\d+'),
-            (TokenType.FLOAT, r'\d+\.\d+'),
-            (TokenType.STRING, r'"[^"]*"'),
-            (TokenType.BOOL, r'true|false'),
-            (TokenType.PLUS, r'\+'),
-            (TokenType.MINUS, r'-'),
-            (TokenType.MULTIPLY, r'\*'),
-            (TokenType.DIVIDE, r'/'),
-            (TokenType.EQUALS, r'='),
-            (TokenType.EQEQ, r'=='),
-            (TokenType.NEQ, r'!='),
-            (TokenType.LT, r'<'),
-            (TokenType.GT, r'>'),
-            (TokenType.LTE, r'<='),
-            (TokenType.GTE, r'>='),
-            (TokenType.LPAREN, r'\('),
-            (TokenType.RPAREN, r'\)'),
-            (TokenType.LBRACE, r'\{'),
-            (TokenType.RBRACE, r'\}'),
-            (TokenType.COMMA, r','),
-            (TokenType.SEMICOLON, r';'),
-            (TokenType.IF, r'if'),
-            (TokenType.ELSE, r'else'),
-            (TokenType.WHILE, r'while'),
-            (TokenType.FOR, r'for'),
-            (TokenType.FUNCTION, r'function'),
-            (TokenType.RETURN, r'return'),
-            (TokenType.VAR, r'var'),
-            (TokenType.PRINT, r'print'),
-            (TokenType.IDENTIFIER, r'[a-zA-Z_][a-zA-Z0-9_]*'),
-        ]
-
-        for token_type, pattern in patterns:
-            regex = re.compile(pattern)
-            match = regex.match(self.text, self.pos)
-            if match:
-                value = match.group()
-                token = Token(token_type, value, self.line, self.column)
-                for _ in range(len(value)):
-                    self.advance()
-                return token
-
-        return None
+    def __init__(self, tokens, capacity=8):
+        self.tokens = tokens
+        self.buffer = [None] * capacity
+        self.start = 0  # Index of the next token in the buffer
+        self.count = 0  # Tokens buffered
+        self.eof = None
+
+    def _fill(self, k):
+        """Make sure at least k + 1 tokens are buffered (or the stream has ended)."""
+        while self.count <= k:
+            if self.eof is not None:
+                return False
+            token = next(self.tokens)
+            if token.type == TokenType.EOF:
+                self.eof = token
+            if self.count == len(self.buffer):
+                # Unroll the ring into a buffer twice as big
+                self.buffer = self.buffer[self.start:] + self.buffer[:self.start] + [None] * len(self.buffer)
+                self.start = 0
+            self.buffer[(self.start + self.count) % len(self.buffer)] = token
+            self.count += 1
+        return True
+
+    def peek(self, k=0):
+        """The k-th token ahead without consuming anything (0 is the next token)."""
+        if not self._fill(k):
+            return self.eof
+        return self.buffer[(self.start + k) % len(self.buffer)]
+
+    def next(self):
+        """Consume and return the next token."""
+        if not self._fill(0):
+            return self.eof
+        token = self.buffer[self.start]
+        self.buffer[self.start] = None
+        self.start = (self.start + 1) % len(self.buffer)
+        self.count -= 1
+        return token
 
 
 # Parser
+# Binary operators: token type -> (precedence, right associative). Higher binds tighter.
+BINARY_OPERATORS = {
+    TokenType.EQEQ: (1, False),
+    TokenType.NEQ: (1, False),
+    TokenType.LT: (1, False),
+    TokenType.GT: (1, False),
+    TokenType.LTE: (1, False),
+    TokenType.GTE: (1, False),
+    TokenType.PLUS: (2, False),
+    TokenType.MINUS: (2, False),
+    TokenType.MULTIPLY: (3, False),
+    TokenType.DIVIDE: (3, False),
+}
+# Prefix operators bind tighter than every binary operator: -a * b is (-a) * b
+UNARY_OPERATORS = {TokenType.MINUS}
+
+
 class Parser:
     def __init__(self, lexer):
         self.lexer = lexer
-        self.current_token = self.lexer.get_next_token()
+        self.tokens = TokenStream(lexer.tokens())
+        self.current_token = self.tokens.next()
+
+    def peek(self, k=1):
+        """The k-th token after the current one."""
+        return self.tokens.peek(k - 1)
 
     def eat(self, token_type):
         if self.current_token.type == token_type:
-            self.current_token = self.lexer.get_next_token()
+            self.current_token = self.tokens.next()
         else:
             raise Exception(f"Expected {token_type}, got {self.current_token.type} at line {self.current_token.line}")
 
@@ -289,8 +364,7 @@ class Parser:
             return self.parse_print_statement()
         elif self.current_token.type == TokenType.IDENTIFIER:
             # Could be assignment or function call
-            next_token = self.lexer.get_next_token()
-            self.lexer.pos -= len(next_token.value)  # Put it back
+            next_token = self.peek()
             if next_token.type == TokenType.EQUALS:
                 return self.parse_assignment()
             elif next_token.type == TokenType.LPAREN:
@@ -395,12 +469,29 @@ class Parser:
         self.eat(TokenType.RBRACE)
         return BlockNode(statements)
 
-    def parse_expression(self):
-        return self.parse_binary_expression(self.parse_term, [
-            (TokenType.EQEQ, TokenType.NEQ, TokenType.LT, TokenType.GT, TokenType.LTE, TokenType.GTE),
-            (TokenType.PLUS, TokenType.MINUS),
-            (TokenType.MULTIPLY, TokenType.DIVIDE)
-        ])
+    def parse_expression(self, min_precedence=1):
+        """
+        Precedence climbing: parse an operand, then keep folding in binary operators that bind
+        at least as tightly as min_precedence. The right operand of a left-associative operator
+        only takes tighter operators, so a - b - c groups as (a - b) - c.
+        """
+        node = self.parse_unary()
+        while True:
+            entry = BINARY_OPERATORS.get(self.current_token.type)
+            if entry is None or entry[0] < min_precedence:
+                return node
+            precedence, right_associative = entry
+            operator = self.current_token.type
+            self.eat(operator)
+            right = self.parse_expression(precedence if right_associative else precedence + 1)
+            node = BinaryOperationNode(node, operator, right)
+
+    def parse_unary(self):
+        if self.current_token.type in UNARY_OPERATORS:
+            operator = self.current_token.type
+            self.eat(operator)
+            return UnaryOperationNode(operator, self.parse_unary())
+        return self.parse_term()
 
     def parse_term(self):
         token = self.current_token
@@ -424,8 +515,7 @@ class Parser:
             return node
         elif token.type == TokenType.IDENTIFIER:
             # Check if it's a function call
-            next_token = self.lexer.get_next_token()
-            self.lexer.pos -= len(next_token.value)  # Put it back
+            next_token = self.peek()
             if next_token.type == TokenType.LPAREN:
                 return self.parse_function_call()
             else:
@@ -434,18 +524,6 @@ class Parser:
         else:
             raise Exception(f"Unexpected token {token.type} at line {token.line}")
 
-    def parse_binary_expression(self, parse_operand, operator_groups):
-        node = parse_operand(self)
-
-        for operators in operator_groups:
-            while self.current_token.type in operators:
-                operator = self.current_token.type
-                self.eat(operator)
-                right = parse_operand(self)
-                node = BinaryOperationNode(node, operator, right)
-
-        return node
-
 
 # AST Printer for visualization
 class ASTPrinter:
@@ -456,7 +534,8 @@ class ASTPrinter:
                 self.print(stmt, indent + 1)
         elif isinstance(node, VariableDeclarationNode):
             print("  " * indent + f"VarDecl: {node.identifier}")
-            self.print(node.value, indent + 1)
+            if node.value is not None:
+                self.print(node.value, indent + 1)
         elif isinstance(node, AssignmentNode):
             print("  " * indent + f"Assign: {node.identifier}")
             self.print(node.value, indent + 1)
@@ -464,6 +543,9 @@ class ASTPrinter:
             print("  " * indent + f"BinaryOp: {node.operator}")
             self.print(node.left, indent + 1)
             self.print(node.right, indent + 1)
+        elif isinstance(node, UnaryOperationNode):
+            print("  " * indent + f"UnaryOp: {node.operator}")
+            self.print(node.operand, indent + 1)
         elif isinstance(node, LiteralNode):
             print("  " * indent + f"Literal: {node.value}")
         elif isinstance(node, IdentifierNode):
@@ -504,6 +586,604 @@ class ASTPrinter:
                 self.print(stmt, indent + 1)
 
 
+# Constant folding
+# Python operators matching what the VM does for each binary operator token
+FOLDABLE_OPERATORS = {
+    TokenType.PLUS: operator.add,
+    TokenType.MINUS: operator.sub,
+    TokenType.MULTIPLY: operator.mul,
+    TokenType.DIVIDE: operator.truediv,
+    TokenType.EQEQ: operator.eq,
+    TokenType.NEQ: operator.ne,
+    TokenType.LT: operator.lt,
+    TokenType.GT: operator.gt,
+    TokenType.LTE: operator.le,
+    TokenType.GTE: operator.ge,
+}
+
+
+def count_nodes(node):
+    """Number of AST nodes in the tree under 'node'."""
+    count = 0
+    stack = [node]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, ASTNode):
+            count += 1
+            stack.extend(getattr(item, field.name) for field in fields(item))
+        elif isinstance(item, list):
+            stack.extend(item)
+    return count
+
+
+class Optimizer:
+    """
+    Folds constant expressions, drops if branches and while loops whose condition is a literal
+    (keeping the 'var' declarations and function definitions they contain, which the compiler
+    hoists, with the variables left uninitialized), and replaces reads of a variable with its
+    value when that is safe: the variable is declared exactly once, with a constant, directly
+    in a statement list, is never assigned or used as a parameter, and the read comes after the
+    declaration in the same list (or in blocks nested in it, but not in function bodies, which
+    may run before the declaration). After optimize(), 'eliminated' holds the number of AST
+    nodes removed.
+    """
+
+    def __init__(self):
+        self.eliminated = 0
+        self.unsafe = set()
+
+    def optimize(self, program):
+        self.unsafe = self.reassigned_names(program)
+        result = ProgramNode(self.optimize_body(program.statements, {}))
+        self.eliminated = count_nodes(program) - count_nodes(result)
+        return result
+
+    @staticmethod
+    def reassigned_names(program):
+        """Names that are assigned, used as parameters or declared more than once."""
+        declared = set()
+        unsafe = set()
+        stack = [program]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, list):
+                stack.extend(item)
+                continue
+            if not isinstance(item, ASTNode):
+                continue
+            if isinstance(item, VariableDeclarationNode):
+                if item.identifier in declared:
+                    unsafe.add(item.identifier)
+                declared.add(item.identifier)
+            elif isinstance(item, AssignmentNode):
+                unsafe.add(item.identifier)
+            elif isinstance(item, FunctionDefinitionNode):
+                unsafe.update(item.parameters)
+            stack.extend(getattr(item, field.name) for field in fields(item))
+        return unsafe
+
+    def optimize_body(self, statements, constants):
+        """Optimize a statement list; 'constants' maps variable names to the literal they hold."""
+        constants = dict(constants)
+        result = []
+        for statement in statements:
+            for new in self.optimize_statement(statement, constants):
+                result.append(new)
+                if (isinstance(new, VariableDeclarationNode) and isinstance(new.value, LiteralNode)
+                        and new.identifier not in self.unsafe):
+                    constants[new.identifier] = new.value
+        return result
+
+    def optimize_block(self, block, constants):
+        return BlockNode(self.optimize_body(block.statements, constants))
+
+    def optimize_statement(self, node, constants):
+        """Optimize one statement into the list of statements that replace it."""
+        if isinstance(node, VariableDeclarationNode):
+            return [VariableDeclarationNode(node.identifier, self.fold(node.value, constants))]
+        if isinstance(node, AssignmentNode):
+            return [AssignmentNode(node.identifier, self.fold(node.value, constants))]
+        if isinstance(node, IfStatementNode):
+            condition = self.fold(node.condition, constants)
+            if isinstance(condition, LiteralNode):
+                # Only the taken branch is left; its statements run unconditionally now
+                branch, dropped = node.then_branch, node.else_branch
+                if not condition.value:
+                    branch, dropped = dropped, branch
+                result = [] if branch is None else self.optimize_body(branch.statements, constants)
+                if dropped is not None:
+                    result.extend(self.hoisted_declarations(dropped.statements))
+                return result
+            else_branch = None
+            if node.else_branch is not None:
+                else_branch = self.optimize_block(node.else_branch, constants)
+            return [IfStatementNode(condition, self.optimize_block(node.then_branch, constants), else_branch)]
+        if isinstance(node, WhileLoopNode):
+            condition = self.fold(node.condition, constants)
+            if isinstance(condition, LiteralNode) and not condition.value:
+                return self.hoisted_declarations(node.body.statements)
+            return [WhileLoopNode(condition, self.optimize_block(node.body, constants))]
+        if isinstance(node, FunctionDefinitionNode):
+            # A function can be called before any declaration it follows, so start from scratch
+            return [FunctionDefinitionNode(node.name, node.parameters, self.optimize_block(node.body, {}))]
+        if isinstance(node, BlockNode):
+            return [self.optimize_block(node, constants)]
+        if isinstance(node, ReturnStatementNode):
+            return [ReturnStatementNode(self.fold(node.value, constants))]
+        if isinstance(node, PrintStatementNode):
+            return [PrintStatementNode(self.fold(node.value, constants))]
+        return [self.fold(node, constants)]
+
+    def hoisted_declarations(self, statements):
+        """
+        What the compiler still needs from statements that are dropped: their 'var'
+        declarations without a value (so nothing is assigned) and their function definitions.
+        """
+        kept = []
+        for node in Compiler.nested_statements(statements):
+            if isinstance(node, VariableDeclarationNode):
+                kept.append(VariableDeclarationNode(node.identifier, None))
+            elif isinstance(node, FunctionDefinitionNode):
+                kept.extend(self.optimize_statement(node, {}))
+        return kept
+
+    def fold(self, node, constants):
+        """
+        Expression with every constant subexpression replaced by its value. The expression is
+        rebuilt in postorder with an explicit stack, so long operator chains are not limited by
+        the recursion limit.
+        """
+        values = []
+        stack = [(node, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if isinstance(node, IdentifierNode):
+                values.append(constants.get(node.name, node))
+            elif isinstance(node, BinaryOperationNode):
+                if not expanded:
+                    stack.extend(((node, True), (node.right, False), (node.left, False)))
+                    continue
+                right = values.pop()
+                left = values.pop()
+                if isinstance(left, LiteralNode) and isinstance(right, LiteralNode):
+                    try:
+                        values.append(LiteralNode(FOLDABLE_OPERATORS[node.operator](left.value, right.value)))
+                        continue
+                    except Exception:
+                        pass  # e.g. division by zero: leave it to fail at run time
+                values.append(BinaryOperationNode(left, node.operator, right))
+            elif isinstance(node, UnaryOperationNode):
+                if not expanded:
+                    stack.extend(((node, True), (node.operand, False)))
+                    continue
+                operand = values.pop()
+                if isinstance(operand, LiteralNode):
+                    try:
+                        values.append(LiteralNode(-operand.value))
+                        continue
+                    except Exception:
+                        pass
+                values.append(UnaryOperationNode(node.operator, operand))
+            elif isinstance(node, FunctionCallNode):
+                if not expanded:
+                    stack.append((node, True))
+                    stack.extend((argument, False) for argument in reversed(node.arguments))
+                    continue
+                start = len(values) - len(node.arguments)
+                arguments = values[start:]
+                del values[start:]
+                values.append(FunctionCallNode(node.name, arguments))
+            else:
+                values.append(node)
+        return values[0]
+
+
+# Bytecode
+# Opcodes. Instructions are stored flat in an array('i'): the opcode followed by its operands.
+(LOAD_CONST, LOAD_LOCAL, STORE_LOCAL, LOAD_GLOBAL, STORE_GLOBAL,
+ ADD, SUB, MUL, DIV, EQ, NE, LT, GT, LE, GE, NEG,
+ JUMP, JUMP_IF_FALSE, CALL, RETURN, POP, PRINT) = range(22)
+
+OPCODE_NAMES = [
+    'LOAD_CONST', 'LOAD_LOCAL', 'STORE_LOCAL', 'LOAD_GLOBAL', 'STORE_GLOBAL',
+    'ADD', 'SUB', 'MUL', 'DIV', 'EQ', 'NE', 'LT', 'GT', 'LE', 'GE', 'NEG',
+    'JUMP', 'JUMP_IF_FALSE', 'CALL', 'RETURN', 'POP', 'PRINT',
+]
+# Number of operands following each opcode
+OPERAND_COUNTS = [1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 2, 0, 0, 0]
+
+BINARY_OPCODES = {
+    TokenType.PLUS: ADD,
+    TokenType.MINUS: SUB,
+    TokenType.MULTIPLY: MUL,
+    TokenType.DIVIDE: DIV,
+    TokenType.EQEQ: EQ,
+    TokenType.NEQ: NE,
+    TokenType.LT: LT,
+    TokenType.GT: GT,
+    TokenType.LTE: LE,
+    TokenType.GTE: GE,
+}
+
+# Deepest chain of nested calls the VM allows
+MAX_CALL_DEPTH = 10000
+
+
+@dataclass
+class CompiledFunction:
+    name: str
+    parameters: int
+    locals: int
+    code: array
+
+
+@dataclass
+class Bytecode:
+    constants: list
+    functions: List[CompiledFunction]  # functions[0] is the top-level program
+    globals: List[str]
+
+
+# Bytecode compiler
+class Compiler:
+    """
+    Compiles a ProgramNode to Bytecode. Top-level variables become global slots and a
+    function's parameters and 'var' declarations become local slots, all numbered at compile
+    time (a 'var' anywhere in a function body is local to the whole function). Functions may
+    be called before their definition.
+    """
+
+    def __init__(self):
+        self.constants = []
+        self.constant_index = {}
+        self.functions = []
+        self.function_index = {}
+        self.definitions = []  # FunctionDefinitionNode by function index (None for the program)
+        self.global_slots = {}
+        self.pending = []  # Function definitions waiting to be compiled
+        self.code = None
+        self.local_slots = None
+
+    def compile(self, program):
+        self.functions.append(None)  # Slot 0 is the top-level program
+        self.definitions.append(None)
+        self.register_functions(program.statements)
+        for name in self.declared_variables(program.statements):
+            self.global_slots.setdefault(name, len(self.global_slots))
+
+        self.functions[0] = self.compile_body('<main>', [], program.statements, top_level=True)
+        while self.pending:
+            node = self.pending.pop()
+            self.functions[self.function_index[node.name]] = self.compile_body(
+                node.name, node.parameters, node.body.statements)
+        return Bytecode(self.constants, self.functions, list(self.global_slots))
+
+    def register_functions(self, statements):
+        for node in self.nested_statements(statements):
+            if isinstance(node, FunctionDefinitionNode):
+                if node.name in self.function_index:
+                    raise Exception(f"Function '{node.name}' is defined twice")
+                self.function_index[node.name] = len(self.functions)
+                self.functions.append(None)
+                self.definitions.append(node)
+                self.pending.append(node)
+                self.register_functions(node.body.statements)
+
+    @staticmethod
+    def nested_statements(statements):
+        """Statements including those inside if/while blocks, but not inside function bodies."""
+        stack = list(reversed(statements))
+        while stack:
+            node = stack.pop()
+            yield node
+            if isinstance(node, BlockNode):
+                stack.extend(reversed(node.statements))
+            elif isinstance(node, IfStatementNode):
+                if node.else_branch is not None:
+                    stack.append(node.else_branch)
+                stack.append(node.then_branch)
+            elif isinstance(node, WhileLoopNode):
+                stack.append(node.body)
+
+    def declared_variables(self, statements):
+        return [node.identifier for node in self.nested_statements(statements)
+                if isinstance(node, VariableDeclarationNode)]
+
+    def compile_body(self, name, parameters, statements, top_level=False):
+        self.code = array('i')
+        self.local_slots = None
+        if not top_level:
+            self.local_slots = {}
+            for parameter in parameters:
+                if parameter in self.local_slots:
+                    raise Exception(f"Parameter '{parameter}' repeated in function '{name}'")
+                self.local_slots[parameter] = len(self.local_slots)
+            for variable in self.declared_variables(statements):
+                self.local_slots.setdefault(variable, len(self.local_slots))
+
+        for statement in statements:
+            self.compile_statement(statement)
+        # Falling off the end returns nothing
+        self.emit(LOAD_CONST, self.constant(None))
+        self.emit(RETURN)
+        local_count = len(self.local_slots) if self.local_slots is not None else 0
+        return CompiledFunction(name, len(parameters), local_count, self.code)
+
+    def constant(self, value):
+        # Keyed by type too, since 1, 1.0 and True are equal dict keys
+        key = (type(value), value)
+        index = self.constant_index.get(key)
+        if index is None:
+            index = self.constant_index[key] = len(self.constants)
+            self.constants.append(value)
+        return index
+
+    def emit(self, *instruction):
+        self.code.extend(instruction)
+        return len(self.code) - 1
+
+    def patch(self, position, target):
+        self.code[position] = target
+
+    def load(self, name):
+        if self.local_slots is not None and name in self.local_slots:
+            self.emit(LOAD_LOCAL, self.local_slots[name])
+        elif name in self.global_slots:
+            self.emit(LOAD_GLOBAL, self.global_slots[name])
+        else:
+            raise Exception(f"Undefined variable '{name}'")
+
+    def store(self, name):
+        if self.local_slots is not None and name in self.local_slots:
+            self.emit(STORE_LOCAL, self.local_slots[name])
+        elif name in self.global_slots:
+            self.emit(STORE_GLOBAL, self.global_slots[name])
+        else:
+            raise Exception(f"Assignment to undeclared variable '{name}'")
+
+    def compile_statement(self, node):
+        if isinstance(node, (VariableDeclarationNode, AssignmentNode)):
+            if node.value is None:
+                return  # Bare declaration: its slot is all it needs
+            self.compile_expression(node.value)
+            self.store(node.identifier)
+        elif isinstance(node, PrintStatementNode):
+            self.compile_expression(node.value)
+            self.emit(PRINT)
+        elif isinstance(node, IfStatementNode):
+            self.compile_expression(node.condition)
+            to_else = self.emit(JUMP_IF_FALSE, 0)
+            self.compile_statement(node.then_branch)
+            if node.else_branch is None:
+                self.patch(to_else, len(self.code))
+            else:
+                to_end = self.emit(JUMP, 0)
+                self.patch(to_else, len(self.code))
+                self.compile_statement(node.else_branch)
+                self.patch(to_end, len(self.code))
+        elif isinstance(node, WhileLoopNode):
+            start = len(self.code)
+            self.compile_expression(node.condition)
+            to_end = self.emit(JUMP_IF_FALSE, 0)
+            self.compile_statement(node.body)
+            self.emit(JUMP, start)
+            self.patch(to_end, len(self.code))
+        elif isinstance(node, BlockNode):
+            for statement in node.statements:
+                self.compile_statement(statement)
+        elif isinstance(node, ReturnStatementNode):
+            self.compile_expression(node.value)
+            self.emit(RETURN)
+        elif isinstance(node, FunctionDefinitionNode):
+            pass  # Compiled separately
+        else:
+            # Expression statement: evaluate and drop the result
+            self.compile_expression(node)
+            self.emit(POP)
+
+    def compile_expression(self, node):
+        """
+        Emits the code of an expression in postorder (operands, then their operator) with an
+        explicit stack, so long operator chains are not limited by the recursion limit.
+        """
+        stack = [(node, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if isinstance(node, LiteralNode):
+                self.emit(LOAD_CONST, self.constant(node.value))
+            elif isinstance(node, IdentifierNode):
+                self.load(node.name)
+            elif isinstance(node, BinaryOperationNode):
+                if expanded:
+                    self.emit(BINARY_OPCODES[node.operator])
+                else:
+                    stack.extend(((node, True), (node.right, False), (node.left, False)))
+            elif isinstance(node, UnaryOperationNode):
+                if expanded:
+                    self.emit(NEG)
+                else:
+                    stack.extend(((node, True), (node.operand, False)))
+            elif isinstance(node, FunctionCallNode):
+                index = self.function_index.get(node.name)
+                if index is None:
+                    raise Exception(f"Undefined function '{node.name}'")
+                if expanded:
+                    self.emit(CALL, index, len(node.arguments))
+                    continue
+                expected = len(self.definitions[index].parameters)
+                if len(node.arguments) != expected:
+                    raise Exception(f"Function '{node.name}' takes {expected} arguments, got {len(node.arguments)}")
+                stack.append((node, True))
+                stack.extend((argument, False) for argument in reversed(node.arguments))
+            else:
+                raise Exception(f"Cannot compile {type(node).__name__} as an expression")
+
+
+def disassemble(bytecode):
+    """Readable listing of every compiled function."""
+    lines = []
+    for function in bytecode.functions:
+        lines.append(f"{function.name} ({function.parameters} params, {function.locals} locals):")
+        code = function.code
+        pc = 0
+        while pc < len(code):
+            op = code[pc]
+            operands = list(code[pc + 1:pc + 1 + OPERAND_COUNTS[op]])
+            note = f"  ; {bytecode.constants[operands[0]]!r}" if op == LOAD_CONST else ""
+            lines.append(f"  {pc:4d} {OPCODE_NAMES[op]:<14}{' '.join(map(str, operands))}{note}")
+            pc += 1 + len(operands)
+    return "\n".join(lines)
+
+
+def format_value(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if value is None:
+        return 'null'
+    return str(value)
+
+
+# Virtual machine
+class VirtualMachine:
+    """
+    Runs Bytecode with one dispatch loop over integer opcodes, an operand stack and a stack
+    of call frames (code, return address, locals). 'output' receives every printed line.
+    """
+
+    def __init__(self, bytecode, output=print):
+        self.bytecode = bytecode
+        self.output = output
+
+    def run(self):
+        """Execute the program and return the value of a top-level return (or None)."""
+        constants = self.bytecode.constants
+        functions = self.bytecode.functions
+        globals_ = [None] * len(self.bytecode.globals)
+        output = self.output
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        frames = []
+
+        main = functions[0]
+        code = main.code
+        local = [None] * main.locals
+        pc = 0
+        while True:
+            op = code[pc]
+            # Most frequent opcodes first
+            if op == LOAD_LOCAL:
+                push(local[code[pc + 1]])
+                pc += 2
+            elif op == LOAD_CONST:
+                push(constants[code[pc + 1]])
+                pc += 2
+            elif op == STORE_LOCAL:
+                local[code[pc + 1]] = pop()
+                pc += 2
+            elif op == JUMP_IF_FALSE:
+                if pop():
+                    pc += 2
+                else:
+                    pc = code[pc + 1]
+            elif op == JUMP:
+                pc = code[pc + 1]
+            elif op == ADD:
+                right = pop()
+                stack[-1] = stack[-1] + right
+                pc += 1
+            elif op == SUB:
+                right = pop()
+                stack[-1] = stack[-1] - right
+                pc += 1
+            elif op == LT:
+                right = pop()
+                stack[-1] = stack[-1] < right
+                pc += 1
+            elif op == LOAD_GLOBAL:
+                push(globals_[code[pc + 1]])
+                pc += 2
+            elif op == STORE_GLOBAL:
+                globals_[code[pc + 1]] = pop()
+                pc += 2
+            elif op == MUL:
+                right = pop()
+                stack[-1] = stack[-1] * right
+                pc += 1
+            elif op == DIV:
+                right = pop()
+                stack[-1] = stack[-1] / right
+                pc += 1
+            elif op == EQ:
+                right = pop()
+                stack[-1] = stack[-1] == right
+                pc += 1
+            elif op == NE:
+                right = pop()
+                stack[-1] = stack[-1] != right
+                pc += 1
+            elif op == GT:
+                right = pop()
+                stack[-1] = stack[-1] > right
+                pc += 1
+            elif op == LE:
+                right = pop()
+                stack[-1] = stack[-1] <= right
+                pc += 1
+            elif op == GE:
+                right = pop()
+                stack[-1] = stack[-1] >= right
+                pc += 1
+            elif op == NEG:
+                stack[-1] = -stack[-1]
+                pc += 1
+            elif op == CALL:
+                function = functions[code[pc + 1]]
+                argc = code[pc + 2]
+                if len(frames) >= MAX_CALL_DEPTH:
+                    raise Exception(f"Maximum call depth exceeded in '{function.name}'")
+                frames.append((code, pc + 3, local))
+                if argc:
+                    local = stack[-argc:]
+                    del stack[-argc:]
+                else:
+                    local = []
+                local.extend([None] * (function.locals - argc))
+                code = function.code
+                pc = 0
+            elif op == RETURN:
+                # The return value stays on top of the stack for the caller
+                if not frames:
+                    return pop()
+                code, pc, local = frames.pop()
+            elif op == POP:
+                pop()
+                pc += 1
+            elif op == PRINT:
+                output(format_value(pop()))
+                pc += 1
+            else:
+                raise Exception(f"Unknown opcode {op} at {pc}")
+
+
+def run_program(program, output=print):
+    """Compile a ProgramNode and run it on the VM."""
+    return VirtualMachine(Compiler().compile(program), output).run()
+
+
+def check_optimized(program, optimized):
+    """
+    Run a program and its optimized version and raise if they print or return something
+    different. Returns the printed lines.
+    """
+    expected, actual = [], []
+    expected_result = run_program(program, expected.append)
+    actual_result = run_program(optimized, actual.append)
+    if actual != expected or actual_result != expected_result:
+        raise Exception(f"Optimized program printed {actual!r} instead of {expected!r}")
+    return actual
+
+
 # Example usage
 if __name__ == "__main__":
     code = """
@@ -534,4 +1214,15 @@ if __name__ == "__main__":
 
     # Print the AST
     printer = ASTPrinter()
-    printer.print(ast)
\ No newline at end of file
+    printer.print(ast)
+
+    # Fold constants and drop dead branches
+    optimizer = Optimizer()
+    optimized = optimizer.optimize(ast)
+    print(f"\nOptimized AST ({optimizer.eliminated} of {count_nodes(ast)} nodes eliminated):")
+    printer.print(optimized)
+
+    # Compile both to bytecode, run them and make sure they agree
+    print("\nOutput:")
+    for line in check_optimized(ast, optimized):
+        print(line)
\ No newline at end of file